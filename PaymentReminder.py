@@ -2,460 +2,965 @@ import os
 import logging
 from datetime import datetime, timedelta
 import pandas as pd
-import pywhatkit
 import json
 import time
 import hashlib
-from typing import Dict, List
-from openpyxl import load_workbook
+import io
+import argparse
+import shutil
+import tempfile
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from analytics import OutcomeStore
+from app_config import load_config, validate_config
+from customer_index import CustomerIndex
+from message_templates import MessageTemplates
+from history_store import HistoryStore, ReminderIndex, RowFingerprintStore, open_history_store
+from log_setup import configure_logging
+from metrics import RunMetrics
+from phone_numbers import PhoneGroups, parse_phone_cells
+from send_queue import FAILED, SendQueue
+from spill import SpillList
+from transport import DeliveryEngine, create_rate_limiter, create_transport
 
-# Configure logging
+# Configure logging until a PaymentReminder applies the logging section of its config
 logging.basicConfig(
     filename='payment_reminder.log',
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Payment modes that are treated as online payments
+ONLINE_MODES = ['gpay', 'g-pay', 'google pay', 'phonepe', 'phone pe', 'phonepay', 'bank transfer', 'bank', 'transfer', 'neft', 'imps', 'rtgs', 'upi']
+# Status values that mark a customer for deactivation
+INACTIVE_STATUSES = ['inactive', 'deactivate', 'cancelled']
+INACTIVE_CUSTOMER_STATUSES = INACTIVE_STATUSES + ['closed']
+SMARTCARD_COLUMNS = ['Smartcard Number', 'Secondry Smartcard Number']
+REQUIRED_COLUMNS = ['Number', 'Name', 'Amount', 'Cycle', 'Mode', 'Status']
+# Every column the reminder logic reads; anything else in the sheet is not loaded
+USED_COLUMNS = REQUIRED_COLUMNS + SMARTCARD_COLUMNS + ['Customer Status', 'SkipUntil', 'Language']
+# Other headers accepted for a column, matched ignoring case and extra spaces; column_aliases in the config adds more
+COLUMN_ALIASES = {
+    'Number': ['Phone', 'Phone Number', 'Mobile', 'Mobile Number'],
+    'Smartcard Number': ['Smartcard', 'Smart Card Number', 'First card'],
+    'Secondry Smartcard Number': ['Secondary Smartcard Number', 'Second Smartcard Number', 'Second card'],
+}
+# Cells whose edits make an incremental run process a row again
+FINGERPRINT_COLUMNS = ['Name', 'Amount', 'Cycle', 'Status', 'Mode', 'Number', 'SkipUntil']
+# Bumped when the way the sheet is read changes, so older cached frames are not reused
+CACHE_FORMAT = 2
+
 class PaymentReminder:
-    def __init__(self):
-        self.config = self._load_config()
+    def __init__(self, config: Optional[Dict] = None, shard: Optional[Tuple[int, int]] = None):
+        """Load config.json, or use the given config dict (e.g. from the shard coordinator)
+
+        With shard=(index, count) only the customers whose phone number group
+        hashes to index out of count are processed, so several processes can
+        split a sheet without sharing a customer or a destination number.
+        """
+        if config is None:
+            self.config = load_config()
+        else:
+            validate_config(config)
+            self.config = config
+        configure_logging(self.config['logging'])
+        self.shard = shard
+        # Phone number groups of the whole sheet, built by run() for sharded runs
+        self.phone_groups: Optional[PhoneGroups] = None
+        # Normalized header -> column name the code uses, for every accepted spelling of a used column
+        self._column_names = {self._header_key(col): col for col in USED_COLUMNS}
+        for aliases in (COLUMN_ALIASES, self.config['column_aliases']):
+            for col, names in aliases.items():
+                for name in [names] if isinstance(names, str) else names:
+                    self._column_names.setdefault(self._header_key(name), col)
+        self.inactive_customers: Optional[SpillList] = None
+        self.paid_smartcards: Optional[SpillList] = None
+        # Per-customer outcomes of each run, kept for trend queries (python analytics.py)
+        self.outcomes: Optional[OutcomeStore] = None
+        if self.config['analytics']['enabled']:
+            self.outcomes = OutcomeStore(
+                self.config['analytics']['path'],
+                self.config['analytics']['format'],
+                self.config['analytics']['rows_per_file']
+            )
+        # Skip index over the reminder history, built on the first reminder check and kept
+        # current by update_reminder_history, so a long-lived instance (e.g. the daemon) builds it once
+        self._reminder_index: Optional[ReminderIndex] = None
+        self.reset_run_state()
+        # Parsed sheet kept between runs of a long-lived instance, with the file fingerprint it was read at
+        self._customer_data_memo: Optional[Tuple[Dict, pd.DataFrame]] = None
+        # Checked before each delivery batch; the daemon uses it to stop sending when a send window closes
+        self.delivery_allowed: Optional[Callable[[], bool]] = None
+        self.reminder_history = self._load_reminder_history()
+        self.row_fingerprints = RowFingerprintStore(self.config['fingerprint_path'])
+        self.send_queue = SendQueue(
+            self.config['send_queue']['path'],
+            max_attempts=self.config['send_queue']['max_attempts'],
+            backoff_base=self.config['send_queue']['backoff_base_seconds'],
+            backoff_max=self.config['send_queue']['backoff_max_seconds']
+        )
+        self.templates = MessageTemplates(self.config['message_templates'])
+        self.transport = create_transport(self.config['delivery'])
+        self.delivery = DeliveryEngine(
+            self.transport,
+            concurrency=self.config['delivery']['concurrency'],
+            limiter=create_rate_limiter(self.config['delivery'], self.transport)
+        )
+        
+    def reset_run_state(self) -> None:
+        """Clear the per-run stats, lists and metrics, keeping stores, templates and the reminder index"""
         self.stats = {
             'online': {'total': 0, 'paid': 0, 'unpaid_amount': 0, 'paid_amount': 0},
             'offline': {'total': 0, 'paid': 0, 'unpaid_amount': 0, 'paid_amount': 0}
         }
         self.failed_messages: List[Dict] = []
-        self.inactive_customers: List[Dict] = []
-        self.paid_smartcards: List[str] = []
-        self.reminder_history = self._load_reminder_history()
-        
-    def _load_config(self):
-        """Load configuration from config.json"""
-        try:
-            with open('config.json', 'r') as f:
-                config = json.load(f)
-            self._validate_config(config)
-            return config
-        except FileNotFoundError:
-            logging.error("config.json not found")
-            raise
-            
-    def _validate_config(self, config: Dict) -> None:
-        """Validate configuration parameters"""
-        required_fields = ['excel_path', 'admin_phones', 'sheet_name']
-        for field in required_fields:
-            if field not in config:
-                raise ValueError(f"Missing required config field: {field}")
-        
-        # Convert to list if it's a string
-        if isinstance(config['admin_phones'], str):
-            config['admin_phones'] = [config['admin_phones']]
-            
-        # Ensure all phone numbers start with +
-        for i, phone in enumerate(config['admin_phones']):
-            if not phone.startswith('+'):
-                config['admin_phones'][i] = f"+{phone}"
-                
-        # Set default time difference if not provided
-        if 'time_difference_hours' not in config:
-            config['time_difference_hours'] = 24
-            logging.info("Using default time difference of 24 hours")
-
-    def _load_reminder_history(self) -> Dict:
-        """Load reminder history from JSON file"""
-        history_file = 'reminder_history.json'
-        if os.path.exists(history_file):
-            try:
-                with open(history_file, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                logging.error(f"Error loading reminder history: {str(e)}")
-                return {}
-        return {}
+        # Extra report sections, e.g. the per-shard breakdown of a coordinated run
+        self.report_sections: List[str] = []
+        # Smartcard lists can hold every row of the sheet, so long lists spill to disk
+        for spill_list in (self.inactive_customers, self.paid_smartcards):
+            if spill_list is not None:
+                spill_list.close()
+        self.inactive_customers = SpillList(self.config['streaming']['spill_threshold'])
+        self.paid_smartcards = SpillList(self.config['streaming']['spill_threshold'])
+        if self.outcomes is not None:
+            self.outcomes.discard()
+        # Dues waiting to be merged into one message per destination number
+        self.planned_reminders: Dict[str, List[Dict]] = {}
+        self._dues_staged = False
+        # Identifies this run's jobs in the persistent send queue
+        self.run_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        # Stage timings and counters, written as a JSON profile at the end of run()
+        self.metrics = RunMetrics(self.run_id)
+        self._today = datetime.now().toordinal()
+        # Smartcards of the customers seen so far in this run; None in streaming runs
+        self.customer_index: Optional[CustomerIndex] = CustomerIndex()
+        self._run_date = pd.Timestamp(datetime.fromordinal(self._today))
+        self._decisions = 0
+
+    def close(self) -> None:
+        """Close the history, fingerprint and send queue stores"""
+        self.reminder_history.close()
+        self.row_fingerprints.close()
+        self.send_queue.close()
+        self.inactive_customers.close()
+        self.paid_smartcards.close()
+        if self.outcomes is not None:
+            self.outcomes.discard()
+
+    def _load_reminder_history(self) -> HistoryStore:
+        """Open the reminder history store"""
+        return open_history_store(self.config)
     
     def _save_reminder_history(self) -> None:
-        """Save reminder history to JSON file"""
+        """Flush the reminder history store"""
         try:
-            with open('reminder_history.json', 'w') as f:
-                json.dump(self.reminder_history, f, indent=2)
+            with self.metrics.timer('save_reminder_history'):
+                self.reminder_history.flush()
             logging.info("Reminder history saved successfully")
         except Exception as e:
             logging.error(f"Error saving reminder history: {str(e)}")
     
-    def _get_customer_data(self, row: pd.Series) -> Dict:
-        """Extract important customer data in human-readable format"""
+    def _get_customer_data(self, row: Dict) -> Dict:
+        """Extract important customer data of a classified row in human-readable format
+
+        The amount is the parsed _amount, so it reads the same whether the
+        Amount column came out as int or float (with or without blank cells,
+        whole or in chunks).
+        """
         important_fields = ['Name', 'Amount', 'Cycle', 'Status']
-        return {field: str(row.get(field, '')) for field in important_fields}
+        data = {field: str(row.get(field, '')) for field in important_fields}
+        data['Amount'] = str(row['_amount'])
+        return data
 
     def _validate_customer_data(self, df: pd.DataFrame) -> None:
         """Validate customer data format"""
-        required_columns = ['Number', 'Name', 'Amount', 'Cycle', 'Mode', 'Status']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
         if missing_columns:
             raise ValueError(f"Missing required columns: {missing_columns}")
             
         # Log warning if smart card columns are missing but don't raise error
-        smart_card_columns = ['Smartcard Number', 'Secondry Smartcard Number']
-        missing_smartcard = [col for col in smart_card_columns if col not in df.columns]
+        missing_smartcard = [col for col in SMARTCARD_COLUMNS if col not in df.columns]
         if missing_smartcard:
             logging.warning(f"Missing smartcard columns: {missing_smartcard}")
 
+    @staticmethod
+    def _header_key(header) -> str:
+        return ' '.join(str(header).split()).lower()
+
+    def _column_map(self, headers) -> Dict:
+        """Map the sheet headers of used columns to their column names
+
+        A header that is the column's own name wins over an alias of it.
+        """
+        mapping = {}
+        for header in headers:
+            col = self._column_names.get(self._header_key(header))
+            if col is None:
+                continue
+            exact = self._header_key(header) == self._header_key(col)
+            if col not in mapping.values() or exact:
+                mapping = {key: value for key, value in mapping.items() if value != col}
+                mapping[header] = col
+        return mapping
+
+    def _use_column(self, header) -> bool:
+        return self._header_key(header) in self._column_names
+
+    def _project_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Rename aliased headers to the used column names, dropping anything else"""
+        mapping = self._column_map(df.columns)
+        return df[list(mapping)].rename(columns=mapping)
+
+    def _read_customer_file(self, path: str) -> pd.DataFrame:
+        """Read only the used columns from an Excel, CSV or Parquet file
+
+        Excel and CSV columns are read as object, so a column of numbers and
+        blanks (e.g. smartcards) does not turn into floats like 41187579440.0,
+        and the values are the same as when the sheet is read in chunks.
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.csv':
+            return self._project_columns(pd.read_csv(path, usecols=self._use_column, dtype=object))
+        if extension in ('.parquet', '.pq'):
+            import pyarrow.parquet as pq
+            available = pq.ParquetFile(path).schema_arrow.names
+            return self._text_columns(self._project_columns(
+                pd.read_parquet(path, columns=[col for col in available if self._use_column(col)])))
+        return self._project_columns(pd.read_excel(path, sheet_name=self.config['sheet_name'],
+                                                   usecols=self._use_column, dtype=object))
+
+    @staticmethod
+    def _text_columns(df: pd.DataFrame) -> pd.DataFrame:
+        """Turn whole-number floats in the Number and smartcard columns back into ints
+
+        Parquet keeps the column types it was written with, so a float column
+        of card numbers would otherwise print as 41187579440.0.
+        """
+        for col in ['Number'] + SMARTCARD_COLUMNS:
+            if col in df.columns and pd.api.types.is_float_dtype(df[col]):
+                df[col] = pd.Series([int(value) if value.is_integer() else value for value in df[col].tolist()],
+                                    index=df.index, dtype=object)
+        return df
+
+    def _file_fingerprint(self, path: str) -> Dict:
+        """Return the mtime and size of a file"""
+        stat = os.stat(path)
+        return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+    def _file_hash(self, path: str) -> str:
+        """Return the SHA-256 of a file's contents"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _cache_paths(self, path: str) -> Tuple[str, str]:
+        """Return the data and metadata paths of the cache for a source file"""
+        name = f"{os.path.basename(path)}.{self.config['sheet_name']}"
+        base = os.path.join(self.config['cache_dir'], name)
+        return f"{base}.pkl", f"{base}.json"
+
+    def _load_cached_customer_data(self, path: str) -> Optional[pd.DataFrame]:
+        """Return the cached frame for path if the source is unchanged, else None"""
+        data_path, meta_path = self._cache_paths(path)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if (meta.get('format') != CACHE_FORMAT or meta.get('columns') != USED_COLUMNS
+                    or meta.get('column_names') != self._column_names):
+                return None
+            fingerprint = self._file_fingerprint(path)
+            if fingerprint != meta['fingerprint']:
+                # Touched but not edited (e.g. copied or re-saved unchanged): compare contents
+                if self._file_hash(path) != meta['sha256']:
+                    return None
+                meta['fingerprint'] = fingerprint
+                with open(meta_path, 'w') as f:
+                    json.dump(meta, f)
+            return pd.read_pickle(data_path)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable customer data cache: {str(e)}")
+            return None
+
+    def _store_cached_customer_data(self, path: str, df: pd.DataFrame) -> None:
+        """Write the projected frame and the source fingerprint to the cache"""
+        data_path, meta_path = self._cache_paths(path)
+        try:
+            os.makedirs(self.config['cache_dir'], exist_ok=True)
+            df.to_pickle(data_path)
+            with open(meta_path, 'w') as f:
+                json.dump({
+                    'format': CACHE_FORMAT,
+                    'source': os.path.abspath(path),
+                    'fingerprint': self._file_fingerprint(path),
+                    'sha256': self._file_hash(path),
+                    'columns': USED_COLUMNS,
+                    'column_names': self._column_names
+                }, f)
+        except Exception as e:
+            logging.warning(f"Could not write customer data cache: {str(e)}")
+
     def get_customer_data(self) -> pd.DataFrame:
-        """Read and validate customer data from Excel file"""
+        """Read and validate customer data from an Excel, CSV or Parquet file"""
+        path = self.config['excel_path']
         try:
-            # Read Excel file
-            df = pd.read_excel(
-                self.config['excel_path'],
-                sheet_name=self.config['sheet_name']
-            )
-            
-            # Clean up any empty rows
-            df = df.dropna(how='all')
-            
+            fingerprint = self._file_fingerprint(path)
+            if self._customer_data_memo is not None and self._customer_data_memo[0] == fingerprint:
+                # A long-lived instance (e.g. the daemon) reuses the sheet until the file changes
+                return self._customer_data_memo[1]
+            df = self._load_cached_customer_data(path) if self.config['use_cache'] else None
+            if df is not None:
+                logging.info(f"Loaded customer data for {path} from cache")
+            else:
+                df = self._read_customer_file(path)
+                
+                # Clean up any empty rows
+                df = df.dropna(how='all')
+                
+                if self.config['use_cache']:
+                    self._store_cached_customer_data(path, df)
             
             self._validate_customer_data(df)
-            logging.info(f"Successfully loaded {len(df)} records from Excel")
+            logging.info(f"Successfully loaded {len(df)} records from {path}")
+            self._customer_data_memo = (fingerprint, df)
             return df
         except Exception as e:
-            logging.error(f"Error reading Excel file: {str(e)}")
+            logging.error(f"Error reading customer data file: {str(e)}")
             raise
 
-    def should_send_reminder(self, customer_number: str, current_data: Dict) -> bool:
+
+    def _iter_excel_chunks(self, path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """Read an Excel sheet in chunks with openpyxl's read-only row iterator"""
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook[self.config['sheet_name']].iter_rows(values_only=True)
+            header = next(rows, None) or ()
+            mapping = self._column_map(col for col in header if col is not None)
+            positions = [(i, mapping[col]) for i, col in enumerate(header) if col in mapping]
+            columns = [col for _, col in positions]
+            offset = 0
+            batch = []
+            for values in rows:
+                record = []
+                for i, _ in positions:
+                    value = values[i] if i < len(values) else None
+                    # Match pandas, which reads whole-number floats as ints and blank cells as NaN
+                    if isinstance(value, float) and value.is_integer():
+                        value = int(value)
+                    elif value is None:
+                        value = float('nan')
+                    record.append(value)
+                batch.append(record)
+                if len(batch) == chunk_size:
+                    # object columns, so types never depend on which rows share a chunk
+                    yield pd.DataFrame(batch, columns=columns, index=range(offset, offset + len(batch)), dtype=object)
+                    offset += len(batch)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=columns, index=range(offset, offset + len(batch)), dtype=object)
+        finally:
+            workbook.close()
+
+    def iter_customer_chunks(self, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """Yield the customer data in validated chunks of at most chunk_size rows"""
+        path = self.config['excel_path']
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.csv':
+            chunks = map(self._project_columns,
+                         pd.read_csv(path, usecols=self._use_column, dtype=object, chunksize=chunk_size))
+        elif extension in ('.parquet', '.pq'):
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(path)
+            columns = [col for col in parquet_file.schema_arrow.names if self._use_column(col)]
+            chunks = (self._text_columns(self._project_columns(batch.to_pandas()))
+                      for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns))
+        else:
+            chunks = self._iter_excel_chunks(path, chunk_size)
+
+        total = 0
+        offset = 0
+        for chunk in chunks:
+            # Keep row labels unique across chunks
+            chunk.index = range(offset, offset + len(chunk))
+            offset += len(chunk)
+            chunk = chunk.dropna(how='all')
+            if total == 0:
+                self._validate_customer_data(chunk)
+            total += len(chunk)
+            yield chunk
+        logging.info(f"Streamed {total} records from {path}")
+
+    def _load_reminder_index(self) -> ReminderIndex:
+        """Build the skip index from the reminder history store"""
+        self._reminder_index = ReminderIndex(self.reminder_history)
+        logging.info(f"Built reminder index with {len(self._reminder_index)} customers")
+        return self._reminder_index
+
+    def _log_decision(self) -> bool:
+        """Return True if this reminder decision should be logged, per decision_log_sample_rate"""
+        rate = self.config['decision_log_sample_rate']
+        if rate <= 0:
+            return False
+        self._decisions += 1
+        return rate >= 1 or self._decisions % round(1 / rate) == 0
+
+    def should_send_reminder(self, customer_key: str, current_data: Dict) -> bool:
         """Determine if a reminder should be sent based on date and data changes"""
-        customer_key = str(customer_number)
-        current_time = datetime.now()
-        current_date = current_time.date()
+        index = self._reminder_index if self._reminder_index is not None else self._load_reminder_index()
         
         # If no previous reminder has been sent to this customer
-        if customer_key not in self.reminder_history:
+        previous = index.lookup(customer_key)
+        if previous is None:
             return True
-        
-        last_reminded = datetime.fromisoformat(self.reminder_history[customer_key]['timestamp'])
-        last_reminded_date = last_reminded.date()
-        previous_data = self.reminder_history[customer_key]['data']
+        last_reminded_day, previous_digest = previous
         
         # If the last reminder was sent on a different day (not today)
-        if current_date > last_reminded_date:
-            logging.info(f"Sending reminder to {customer_number} - last reminder was on {last_reminded_date}, sending new one today")
+        if self._today > last_reminded_day:
+            if self._log_decision():
+                logging.info("Sending reminder to %s - last reminder was on %s, sending new one today",
+                             customer_key, datetime.fromordinal(last_reminded_day).date())
             return True
         
         # If it's the same day, only send if data has changed
-        if previous_data != current_data:
-            logging.info(f"Sending reminder to {customer_number} - data changed since last reminder")
+        if previous_digest != index.digest(current_data):
+            if self._log_decision():
+                logging.info("Sending reminder to %s - data changed since last reminder", customer_key)
             return True
             
-        logging.info(f"Skipping reminder for {customer_number} - already sent today ({current_date})")
+        if self._log_decision():
+            logging.info("Skipping reminder for %s - already sent today (%s)",
+                         customer_key, datetime.fromordinal(self._today).date())
         return False
 
-    def update_reminder_history(self, customer_number: str, customer_data: Dict) -> None:
-        """Update the reminder history for a customer"""
-        customer_key = str(customer_number)
+    def update_reminder_history(self, customer_key: str, customer_data: Dict) -> None:
+        """Update the reminder history for a customer; the SQLite store commits immediately"""
+        now = datetime.now()
         self.reminder_history[customer_key] = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': now.isoformat(),
             'data': customer_data
         }
+        if self._reminder_index is not None:
+            self._reminder_index.record(customer_key, now.toordinal(), customer_data)
+
+    def plan_reminder(self, phones: List[Tuple[str, str]], invalid: List[str], name: str, amount: float,
+                      cycle: str, mode: str, customer_number: str = None, customer_data: Dict = None,
+                      language: str = None, history_key: str = None) -> bool:
+        """Plan a reminder to already parsed numbers: (E.164, as written) pairs and entries that are not numbers
 
-    def send_whatsapp_message(self, number_value, name: str, amount: float, cycle: str, mode: str) -> bool:
-        """Send WhatsApp message with error handling to one or multiple numbers"""
-        # Check for missing or invalid phone number
-        if pd.isna(number_value):
-            logging.error(f"Cannot send message to {name}: Missing phone number")
+        The customer's reminder history is updated under history_key once a
+        message to one of the numbers is delivered.
+        """
+        for number in invalid:
+            logging.error("Error sending message to %s at number %s: not a valid phone number", name, number)
+            self.metrics.increment('invalid_numbers')
             self.failed_messages.append({
                 'name': name,
-                'number': 'Missing',
+                'number': number,
                 'amount': amount,
                 'cycle': cycle,
                 'mode': mode,
-                'error': 'Missing phone number'
+                'error': 'Invalid phone number'
             })
-            return False
 
-        # Check if mode is bank transfer related
-        mode_lower = mode.lower().strip()
-        is_bank_transfer = any(term in mode_lower for term in ['bank', 'transfer', 'neft', 'imps', 'rtgs'])
-        
-        base_message = (
-            f"*📺 CABLE TV PAYMENT REMINDER 📺*\n\n"
-            f"Dear Customer,\n\n"
-            f"We request you to kindly pay your Cable TV subscription.\n"
-            f"💰 *Amount Due: ₹{amount}*\n"
-            f"📅 *Period: {cycle}*\n\n"
-            f"*Payment Options:*\n"
-            f"📱 *UPI/Mobile Payment:*\n"
-            f"   9444047656 (Pandian)\n"
-            f"   (GPay/PhonePe/Paytm/WhatsApp)\n\n"
-        )
-        
-        bank_details = (
-            f"🏦 *Bank Transfer:*\n"
-            f"   Account holder: GOWTHAM RAJ\n"
-            f"   A/C No: 50100371282075\n"
-            f"   Bank: HDFC BANK\n"
-            f"   Branch: VALSARAVAKKAM\n"
-            f"   IFSC: HDFC0000024\n\n"
-        )
+        planned = False
+        for phone, number in phones:
+            self.planned_reminders.setdefault(phone, []).append({
+                'name': name,
+                'number': number,
+                'amount': amount,
+                'cycle': cycle,
+                'mode': mode,
+                'customer_number': customer_number,
+                'history_key': history_key,
+                'customer_data': customer_data,
+                'language': language or self.templates.default_language
+            })
+            planned = True
         
-        footer = (
-            f"📸 Please share a screenshot after payment.\n\n"
-            f"_Note: Please ignore if already paid. This is an automated message._\n\n"
-            f"Thank you for your continued support! 🙏\n"
-            f"- The Best Cable Vision"
+        return planned
+
+    def stage_planned_reminders(self) -> None:
+        """Move planned dues to disk so they do not accumulate in memory"""
+        self.send_queue.stage_dues(
+            self.run_id,
+            ((phone, due) for phone, dues in self.planned_reminders.items() for due in dues)
         )
-        
-        # Include bank details only for bank transfer payment modes
-        if is_bank_transfer:
-            message = base_message + bank_details + footer
+        self.planned_reminders = {}
+        self._dues_staged = True
+
+    def queue_planned_reminders(self) -> int:
+        """Put one message per destination number on the send queue
+
+        Dues planned for the same number, e.g. several connections in one
+        household, are merged into a single consolidated message. Returns the
+        number of messages queued.
+        """
+        if self._dues_staged:
+            self.stage_planned_reminders()
+            planned = self.send_queue.staged_dues(self.run_id)
         else:
-            message = base_message + footer
+            planned = iter(self.planned_reminders.items())
+        queued = 0
+        merged = 0
+        numbers = 0
+        for phone, dues in planned:
+            numbers += 1
+            if len(dues) > 1:
+                merged += len(dues) - 1
+            if self.send_queue.enqueue(self.run_id, {
+                'phone': phone,
+                'message': self.templates.render_reminder(dues),
+                'customers': dues
+            }):
+                queued += 1
+        self.metrics.increment('messages_queued', queued)
+        logging.info(f"Queued {queued} reminder messages for {numbers} numbers "
+                     f"({merged} dues merged into shared-number messages)")
+        self.planned_reminders = {}
+        if self._dues_staged:
+            self.send_queue.clear_staged_dues(self.run_id)
+            self._dues_staged = False
+        return queued
 
-        # Parse semicolon-separated phone numbers
-        numbers = str(number_value).split(';')
-        success = False
-        
-        for number in numbers:
-            number = number.strip()
-            if not number:
+    def deliver_queued_messages(self) -> None:
+        """Deliver due messages from the send queue until none are pending
+
+        Failed sends are retried with exponential backoff until they run out of
+        attempts; only then are they added to failed_messages.
+        """
+        while True:
+            if self.delivery_allowed is not None and not self.delivery_allowed():
+                logging.info("Delivery paused outside the send window; unsent messages stay queued")
+                break
+            batch = self.send_queue.claim_due(self.config['send_queue']['batch_size'])
+            if not batch:
+                wait = self.send_queue.seconds_until_next()
+                if wait is None:
+                    break
+                logging.info(f"Waiting {wait:.1f}s for the next retry")
+                time.sleep(wait)
                 continue
-                
-            try:
-                pywhatkit.sendwhatmsg_instantly(
-                    f"+91{str(round(float(number)))}",
-                    message,
-                    15,
-                    True,
-                    3
-                )
-                logging.info(f"Reminder sent to {name} at number {number}")
-                success = True
-                time.sleep(3)  # Add a short delay between messages to multiple numbers
-            except Exception as e:
-                logging.error(f"Error sending message to {name} at number {number}: {str(e)}")
-                self.failed_messages.append({
-                    'name': name,
-                    'number': number,
-                    'amount': amount,
-                    'cycle': cycle,
-                    'mode': mode,
-                    'error': str(e)
-                })
-        
-        return success
-
-    def collect_smartcards(self, row: pd.Series) -> List[str]:
-        """Extract smartcard numbers from a customer row"""
-        smartcards = []
-        if 'Smartcard Number' in row and pd.notna(row['Smartcard Number']):
-            smartcards.append(str(row['Smartcard Number']).strip())
-        if 'Secondry Smartcard Number' in row and pd.notna(row['Secondry Smartcard Number']):
-            smartcards.append(str(row['Secondry Smartcard Number']).strip())
-        return [card for card in smartcards if card]  # Filter out empty strings
-
-    def process_customer(self, row: pd.Series) -> None:
-        """Process individual customer data"""
-        # Check for missing or NaN phone number
-        if pd.isna(row.get('Number')):
-            logging.warning(f"Skipping customer with missing phone number: {row.get('Name', 'Unknown')}")
+            for job in batch:
+                self.delivery.submit(job)
+            self.delivery.flush(on_result=self._record_delivery_result)
+
+    def _record_delivery_result(self, result: Dict) -> None:
+        """Checkpoint the outcome of one send in the queue and the reminder history"""
+        customers = result['customers']
+        names = ', '.join(str(customer['name']) for customer in customers)
+        number = customers[0]['number']
+        self.metrics.observe('send', result['latency'])
+        if result['success']:
+            self.send_queue.mark_sent(result['id'])
+            self.metrics.increment('messages_sent')
+            logging.info("Reminder sent to %s at number %s", names, number)
+            self._stage_delivery_outcome(result, 'sent')
+            # Update reminder history of every customer in the message once it was sent successfully
+            for customer in customers:
+                if customer.get('history_key') is not None:
+                    self.update_reminder_history(customer['history_key'], customer['customer_data'])
             return
-            
-        # Check if customer is inactive - do this early to exclude from calculations
-        is_inactive = False
-        status = str(row['Status']).lower().strip()
-        
-        # Check Status column
-        if status.lower() in ['inactive', 'deactivate', 'cancelled']:
-            is_inactive = True
-            
-        # Also check Customer Status column if it exists
-        if 'Customer Status' in row and pd.notna(row['Customer Status']):
-            customer_status = str(row['Customer Status']).lower().strip()
-            if customer_status in ['inactive', 'deactivate', 'cancelled', 'closed']:
-                is_inactive = True
-                logging.info(f"Found inactive customer via Customer Status column: {row['Name']}")
-        
-        # Collect smartcard numbers for inactive customers but exclude from stats
-        if is_inactive:
-            smartcards = self.collect_smartcards(row)
+
+        state = self.send_queue.mark_failed(result['id'], result['error'])
+        self.metrics.increment('send_failures')
+        logging.error("Error sending message to %s at number %s (attempt %d): %s",
+                      names, number, result['attempts'] + 1, result['error'])
+        if state == FAILED:
+            self.metrics.increment('messages_failed')
+            self._stage_delivery_outcome(result, 'failed')
+            for customer in customers:
+                self.failed_messages.append(dict(customer, error=result['error'], job_id=result['id']))
+
+    def _stage_delivery_outcome(self, result: Dict, outcome: str) -> None:
+        """Record the final result of a reminder for every customer in the message"""
+        if self.outcomes is None:
+            return
+        self.outcomes.stage('deliveries', [{
+            'run_id': self.run_id,
+            'run_date': self._run_date,
+            'customer_number': customer['customer_number'],
+            'phone': result['phone'],
+            'result': outcome,
+            'attempts': result['attempts'] + 1,
+            'latency': result['latency']
+        } for customer in result['customers'] if customer['customer_number'] is not None])
+
+    def classify_customers(self, df: pd.DataFrame, occurrences: Optional[Dict] = None) -> pd.DataFrame:
+        """Classify every row of df at once, as whole columns
+
+        Adds the columns _has_number, _inactive, _skip, _mode, _paid, _amount,
+        _phones ((E.164, as written) pairs), _invalid_numbers, _customer_number,
+        _history_key and _language, plus _counted (row contributes to stats) and
+        _reminder_candidate (unpaid online row that may need a reminder).
+        occurrences carries the history key counters between chunks.
+        """
+        classified = df.copy()
+        has_number = df['Number'].notna()
+        for name in df.loc[~has_number, 'Name'].fillna('Unknown'):
+            logging.warning("Skipping customer with missing phone number: %s", name)
+
+        # Inactive customers via Status and the optional Customer Status column
+        status = df['Status'].astype(str).str.lower().str.strip()
+        inactive = status.isin(INACTIVE_STATUSES)
+        if 'Customer Status' in df.columns:
+            customer_status = df['Customer Status']
+            inactive |= customer_status.notna() & customer_status.astype(str).str.lower().str.strip().isin(INACTIVE_CUSTOMER_STATUSES)
+
+        # SkipUntil dates in DD/MM/YYYY format; cells Excel already parsed as dates are used as-is
+        skip = pd.Series(False, index=df.index)
+        if 'SkipUntil' in df.columns:
+            skip_values = df['SkipUntil']
+            present = skip_values.notna()
+            if pd.api.types.is_datetime64_any_dtype(skip_values):
+                skip_dates = skip_values
+            else:
+                is_text = skip_values.map(lambda value: isinstance(value, str))
+                skip_dates = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+                skip_dates[present & is_text] = pd.to_datetime(skip_values[present & is_text], format='%d/%m/%Y', errors='coerce')
+                skip_dates[present & ~is_text] = pd.to_datetime(skip_values[present & ~is_text], errors='coerce')
+            invalid = present & skip_dates.isna()
+            for name, value in zip(df.loc[invalid, 'Name'].fillna('Unknown'), skip_values[invalid]):
+                logging.warning("Invalid date format in SkipUntil for %s: %s", name, value)
+            skip = ~inactive & skip_dates.notna() & (skip_dates.dt.normalize() >= pd.Timestamp(datetime.now().date()))
+            logging.info(f"Skipping {int((skip & has_number).sum())} customers with an active SkipUntil date")
+
+        mode = df['Mode'].astype(str).str.lower().str.strip()
+        is_online = mode.isin(ONLINE_MODES) | (mode == 'online')
+        unknown_modes = mode[has_number & ~inactive & ~skip & ~is_online & (mode != 'offline')]
+        for unknown_mode, count in unknown_modes.value_counts().items():
+            logging.warning(f"Unknown payment mode '{unknown_mode}' for {count} customers, defaulting to offline")
+
+        # Missing or non-numeric amounts count as 0
+        amount = pd.to_numeric(df['Amount'], errors='coerce')
+        invalid_amount = amount.isna() & has_number & ~inactive & ~skip
+        if invalid_amount.any():
+            logging.warning(f"Missing or invalid amount for {int(invalid_amount.sum())} customers, using 0")
+
+        # Each distinct Number cell is parsed once into E.164 numbers and the reminder history key
+        phone_config = self.config['phone_numbers']
+        parsed = df['Number'].map(parse_phone_cells(
+            pd.unique(df['Number']), phone_config['country_code'], phone_config['national_digits']))
+
+        classified['_has_number'] = has_number
+        classified['_inactive'] = has_number & inactive
+        classified['_skip'] = has_number & ~inactive & skip
+        classified['_mode'] = is_online.map({True: 'online', False: 'offline'})
+        classified['_paid'] = status == 'paid'
+        classified['_amount'] = amount.fillna(0).astype(float)
+        classified['_phones'] = [cell[0] for cell in parsed]
+        classified['_invalid_numbers'] = [cell[1] for cell in parsed]
+        classified['_customer_number'] = [cell[2] for cell in parsed]
+        classified['_history_key'] = self.history_keys(classified, occurrences)
+        classified['_counted'] = has_number & ~inactive & ~skip
+        classified['_reminder_candidate'] = classified['_counted'] & ~classified['_paid'] & is_online
+        # Message language, resolved once per distinct cell value
+        if 'Language' in df.columns:
+            classified['_language'] = df['Language'].map(self.templates.language_for)
+        else:
+            classified['_language'] = self.templates.default_language
+        return classified
+
+    def _ordered_smartcards(self, df: pd.DataFrame) -> pd.Series:
+        """Return the non-empty smartcard numbers of all rows, row by row with the primary card first"""
+        parts = []
+        for col in SMARTCARD_COLUMNS:
+            if col not in df.columns:
+                continue
+            cards = df[col]
+            cards = cards[cards.notna()].astype(str).str.strip()
+            parts.append(cards[cards != ''])
+        if not parts:
+            return pd.Series([], dtype=object)
+        # Stable sort keeps the primary card ahead of the secondary one within a row
+        return pd.concat(parts).sort_index(kind='stable')
+
+    def apply_classification(self, classified: pd.DataFrame) -> pd.DataFrame:
+        """Fold classified rows into stats and smartcard lists, returning the reminder candidates"""
+        counted = classified[classified['_counted']]
+        amounts = counted['_amount']
+        totals = pd.DataFrame({
+            'mode': counted['_mode'],
+            'paid': counted['_paid'],
+            'paid_amount': amounts.where(counted['_paid'], 0.0),
+            'unpaid_amount': amounts.where(~counted['_paid'], 0.0)
+        }).groupby('mode').agg(
+            total=('paid', 'size'),
+            paid=('paid', 'sum'),
+            paid_amount=('paid_amount', 'sum'),
+            unpaid_amount=('unpaid_amount', 'sum')
+        )
+        for mode, row in totals.iterrows():
+            self.stats[mode]['total'] += int(row['total'])
+            self.stats[mode]['paid'] += int(row['paid'])
+            self.stats[mode]['paid_amount'] += float(row['paid_amount'])
+            self.stats[mode]['unpaid_amount'] += float(row['unpaid_amount'])
+
+        # Add smartcards from paid customers to the paid_smartcards list
+        self.paid_smartcards.extend(self._ordered_smartcards(counted[counted['_paid']]).tolist())
+
+        # Collect smartcard numbers for inactive customers but exclude them from stats
+        inactive = classified[classified['_inactive']]
+        inactive_cards: Dict = {}
+        for index, card in self._ordered_smartcards(inactive).items():
+            inactive_cards.setdefault(index, []).append(card)
+        for index, name, number in zip(inactive.index, inactive['Name'], inactive['Number']):
+            cards = inactive_cards.get(index, [])
             self.inactive_customers.append({
-                'name': row['Name'],
-                'number': row['Number'],
-                'smartcards': smartcards if smartcards else ['No smartcard']
+                'name': name,
+                'number': number,
+                'smartcards': cards if cards else ['No smartcard']
             })
-            logging.info(f"Added inactive customer for deactivation: {row['Name']} with smartcards: {smartcards}")
-            return  # Skip the rest of processing for inactive customers
-            
-        # Check if reminder should be skipped based on SkipUntil column
-        if 'SkipUntil' in row and pd.notna(row['SkipUntil']):
-            try:
-                # Try to parse the date - should be in DD/MM/YYYY format
-                skip_until_date = pd.to_datetime(row['SkipUntil'], format='%d/%m/%Y').date()
-                current_date = datetime.now().date()
-                
-                if current_date <= skip_until_date:
-                    logging.info(f"Skipping reminder for {row.get('Name', 'Unknown')} until {skip_until_date}")
-                    return
-            except Exception as e:
-                logging.warning(f"Invalid date format in SkipUntil for {row.get('Name', 'Unknown')}: {str(e)}")
-            
-        mode = str(row['Mode']).lower().strip()
-        original_mode = row['Mode']  # Keep original mode for message customization
-        if mode in ['gpay', 'g-pay', 'google pay', 'phonepe', 'phone pe', 'phonepay', 'bank transfer', 'bank', 'transfer', 'neft', 'imps', 'rtgs', 'upi']:
-            mode = 'online'
-        elif mode not in ['online', 'offline']:
-            logging.warning(f"Unknown payment mode '{mode}' for customer {row['Name']}, defaulting to offline")
-            mode = 'offline'
-        
-        # Handle missing or non-numeric amount values
-        try:
-            if pd.isna(row['Amount']):
-                amount = 0
-                logging.warning(f"Missing amount for customer {row['Name']}, using 0")
-            else:
-                amount = float(row['Amount'])
-        except (ValueError, TypeError):
-            logging.warning(f"Invalid amount format for customer {row['Name']}, using 0")
-            amount = 0
-            
-        # Get primary number for reminder history key (first number or full value)
-        number_value = row['Number']
-        numbers = str(number_value).split(';')
-        primary_number = numbers[0].strip() if numbers else str(number_value)
-        
-        try:
-            customer_number = str(round(float(primary_number)))
-        except ValueError:
-            logging.warning(f"Invalid phone number format for {row.get('Name', 'Unknown')}: {primary_number}")
-            customer_number = hashlib.md5(str(primary_number).encode()).hexdigest()[:10]
-            
-        customer_data = self._get_customer_data(row)
-        
-        # Get smartcard numbers for this customer
-        smartcards = self.collect_smartcards(row)
-
-        # Update statistics
-        self.stats[mode]['total'] += 1
-        if status == 'paid':
-            self.stats[mode]['paid'] += 1
-            self.stats[mode]['paid_amount'] += amount
-            
-            # Add smartcards from paid customers to the paid_smartcards list
-            self.paid_smartcards.extend(smartcards)
-            
+            logging.info("Added inactive customer for deactivation: %s with smartcards: %s", name, cards)
+
+        return classified[classified['_reminder_candidate']]
+
+    def index_customers(self, classified: pd.DataFrame) -> None:
+        """Add the smartcards of classified rows to the run's customer index"""
+        rows = classified[classified['_has_number']]
+        cards = self._ordered_smartcards(rows)
+        owners = rows.loc[cards.index]
+        # Lists iterate much faster than pandas string arrays
+        self.customer_index.add_smartcards(cards.tolist(), owners['_customer_number'].tolist(),
+                                           owners['Name'].astype(str).tolist())
+
+    def group_phones(self, streaming: bool = False) -> PhoneGroups:
+        """Group the phone numbers of the whole sheet, reading it once more in chunks when streaming"""
+        phone_config = self.config['phone_numbers']
+        groups = PhoneGroups(phone_config['country_code'], phone_config['national_digits'])
+        if streaming:
+            for chunk in self.iter_customer_chunks(self.config['streaming']['chunk_size']):
+                groups.add_cells(pd.unique(chunk['Number'].dropna()))
         else:
-            self.stats[mode]['unpaid_amount'] += amount
-            if mode == 'online':
-                # Check if we should send a reminder
-                if self.should_send_reminder(customer_number, customer_data):
-                    if self.send_whatsapp_message(
-                        row['Number'],
-                        row['Name'],
-                        amount,
-                        row['Cycle'],
-                        original_mode  # Pass the original mode to customize the message
-                    ):
-                        # Update reminder history only if message was sent successfully
-                        self.update_reminder_history(customer_number, customer_data)
-                else:
-                    logging.info(f"Skipping reminder for {row['Name']} - recent reminder with no data change")
+            groups.add_cells(pd.unique(self.get_customer_data()['Number'].dropna()))
+        logging.info(f"Grouped {len(groups.parent)} phone numbers for sharding")
+        return groups
 
-    def retry_failed_messages(self) -> None:
-        """Retry sending failed messages"""
-        if not self.failed_messages:
+    def _shard_rows(self, classified: pd.DataFrame) -> pd.DataFrame:
+        """Keep the rows whose phone number group falls in this instance's shard
+
+        Rows without a valid number are placed by their customer number.
+        """
+        index, count = self.shard
+        if self.phone_groups is None:
+            self.phone_groups = PhoneGroups(self.config['phone_numbers']['country_code'],
+                                            self.config['phone_numbers']['national_digits'])
+            self.phone_groups.add_cells(pd.unique(classified['Number'].dropna()))
+        keys = [self.phone_groups.find(phones[0][0]) if phones else customer_number
+                for phones, customer_number in zip(classified['_phones'].tolist(),
+                                                   classified['_customer_number'].tolist())]
+        # hash_array is stable across processes, unlike the built-in hash()
+        buckets = pd.util.hash_array(pd.Series(keys, dtype=object).to_numpy()) % count
+        return classified[buckets == index]
+
+    @staticmethod
+    def _occurrences(keys: pd.Series, occurrences: Optional[Dict] = None) -> pd.Series:
+        """Number the rows sharing a key 0, 1, 2, ... in sheet order
+
+        When the sheet is read in chunks, occurrences carries the counters from
+        one chunk to the next.
+        """
+        occurrence = keys.groupby(keys).cumcount()
+        if occurrences is not None:
+            occurrence += keys.map(occurrences).fillna(0).astype(int)
+            for key, count in keys.value_counts().items():
+                occurrences[key] = occurrences.get(key, 0) + count
+        return occurrence
+
+    def history_keys(self, classified: pd.DataFrame, occurrences: Optional[Dict] = None) -> pd.Series:
+        """Return the reminder history key of every row with a phone number
+
+        The key is the customer number and the name, so customers sharing a
+        household number keep separate history entries. A second row with the
+        same number and name gets '#1' appended, a third '#2', and so on.
+        """
+        rows = classified[classified['_has_number']]
+        keys = rows['_customer_number'].astype(object) + ':' + [' '.join(str(name).split()) for name in rows['Name']]
+        occurrence = self._occurrences(keys, occurrences)
+        return keys.where(occurrence == 0, keys + '#' + occurrence.astype(str))
+
+    def compute_row_fingerprints(self, classified: pd.DataFrame, occurrences: Optional[Dict] = None) -> pd.DataFrame:
+        """Return a stable key and a content hash for every row with a phone number
+
+        Rows are keyed by their customer number plus an occurrence counter, so
+        rows sharing a phone number still get distinct keys.
+        """
+        rows = classified[classified['_has_number']]
+        columns = [col for col in FINGERPRINT_COLUMNS if col in rows.columns]
+        # The parsed amount, so an int and a float Amount column hash the same
+        cells = rows[columns].assign(Amount=rows['_amount']).astype(str)
+        hashes = pd.util.hash_pandas_object(cells, index=False)
+        occurrence = self._occurrences(rows['_customer_number'], occurrences)
+        return pd.DataFrame({
+            'row_key': rows['_customer_number'] + '#' + occurrence.astype(str),
+            'fingerprint': hashes.astype(str),
+            'customer_number': rows['_customer_number']
+        }, index=rows.index)
+
+    def changed_rows(self, fingerprints: pd.DataFrame) -> pd.DataFrame:
+        """Keep the rows that are new, edited, or not yet processed today"""
+        previous = self.row_fingerprints.lookup(fingerprints['row_key'].tolist())
+        today = datetime.now().toordinal()
+        changed = [
+            key not in previous or previous[key][0] != fingerprint or previous[key][1] < today
+            for key, fingerprint in zip(fingerprints['row_key'], fingerprints['fingerprint'])
+        ]
+        return fingerprints[changed]
+
+    def stage_row_fingerprints(self, fingerprints: pd.DataFrame, touched: pd.DataFrame) -> None:
+        """Remember the rows seen and processed in this run until save_row_fingerprints()"""
+        self.row_fingerprints.stage(
+            fingerprints['row_key'],
+            zip(touched['row_key'], touched['fingerprint'], touched['customer_number'])
+        )
+
+    def save_row_fingerprints(self) -> None:
+        """Record the rows processed in this run
+
+        Rows whose delivery failed, or is still queued because the send window
+        closed, stay pending so the next incremental run queues them again.
+        """
+        pending = {msg.get('customer_number') for msg in self.failed_messages if msg.get('customer_number')}
+        try:
+            pending |= self.send_queue.unfinished_customers(self.run_id)
+            self.row_fingerprints.commit(datetime.now().toordinal(), pending)
+        except Exception as e:
+            logging.error(f"Error saving row fingerprints: {str(e)}")
+
+    def process_chunk(self, df: pd.DataFrame, incremental: bool = False,
+                      occurrences: Optional[Dict] = None, plan_reminders: bool = True) -> None:
+        """Classify a block of rows, fold it into stats and plan its reminders"""
+        with self.metrics.timer('classification'):
+            classified = self.classify_customers(df, occurrences)
+            if self.shard is not None:
+                classified = self._shard_rows(classified)
+            candidates = self.apply_classification(classified)
+        if self.customer_index is not None:
+            with self.metrics.timer('customer_index'):
+                self.index_customers(classified)
+        self.metrics.increment('rows', len(classified))
+        self.metrics.increment('inactive', int(classified['_inactive'].sum()))
+        self.metrics.increment('skipped_until', int(classified['_skip'].sum()))
+        reminders = pd.Series('', index=classified.index, dtype=object)
+        if not plan_reminders:
+            # Stats only: rows are not marked as processed, so reminders still go out later
+            self.stage_outcomes(classified, reminders)
             return
-            
-        logging.info(f"Retrying {len(self.failed_messages)} failed messages")
-        retry_messages = self.failed_messages.copy()
-        self.failed_messages.clear()
+        with self.metrics.timer('row_fingerprints'):
+            fingerprints = self.compute_row_fingerprints(classified, occurrences)
+            touched = self.changed_rows(fingerprints) if incremental else fingerprints
+            self.stage_row_fingerprints(fingerprints, touched)
+        if incremental:
+            reminders[candidates.index] = 'unchanged'
+            candidates = candidates[candidates.index.isin(touched.index)]
+            logging.info(f"Incremental run: {len(touched)} of {len(fingerprints)} rows changed")
         
-        for msg in retry_messages:
-            time.sleep(5)  # Short delay between retries
-            
-            if self.send_whatsapp_message(
-                msg['number'],
-                msg['name'],
-                msg['amount'],
-                msg['cycle'],
-                msg['mode']
+        total_records = len(candidates)
+        logging.info(f"Classified {len(classified)} records, {total_records} reminder candidates")
+        decisions = []
+        for idx, row in enumerate(candidates.to_dict('records')):
+            decisions.append(self.remind_customer(row))
+            if (idx + 1) % 10 == 0:
+                logging.info("Processed %d/%d reminder candidates", idx + 1, total_records)
+        reminders[candidates.index] = decisions
+        self.stage_outcomes(classified, reminders)
+
+    def stage_outcomes(self, classified: pd.DataFrame, reminders: pd.Series) -> None:
+        """Stage one outcome row per customer row with a phone number for the analytics store"""
+        if self.outcomes is None:
+            return
+        rows = classified[classified['_has_number']]
+        status = pd.Series('unpaid', index=rows.index, dtype=object)
+        status[rows['_paid']] = 'paid'
+        status[rows['_skip']] = 'skip_until'
+        status[rows['_inactive']] = 'inactive'
+        self.outcomes.stage('outcomes', pd.DataFrame({
+            'run_id': self.run_id,
+            'run_date': self._run_date,
+            'customer_number': rows['_customer_number'],
+            'name': rows['Name'].astype(str),
+            'mode': rows['_mode'],
+            'amount': rows['_amount'],
+            'status': status,
+            'reminder': reminders[rows.index]
+        }))
+
+    def remind_customer(self, row: Dict) -> str:
+        """Queue a reminder for an unpaid online customer produced by classify_customers
+
+        Returns the decision: 'planned', 'skipped' or 'invalid_number'.
+        """
+        customer_data = self._get_customer_data(row)
+        with self.metrics.timer('should_send_reminder'):
+            send = self.should_send_reminder(row['_history_key'], customer_data)
+        if send:
+            # History is updated once the delivery engine reports success
+            if self.plan_reminder(
+                row['_phones'],
+                row['_invalid_numbers'],
+                row['Name'],
+                row['_amount'],
+                row['Cycle'],
+                row['Mode'],  # Pass the original mode to customize the message
+                row['_customer_number'],
+                customer_data,
+                row['_language'],
+                row['_history_key']
             ):
-                # Update reminder history for successfully retried messages
-                # If the number is a string like 'Missing', handle it appropriately
-                if isinstance(msg['number'], str) and msg['number'] == 'Missing':
-                    continue
-                    
-                # Handle either single number or semicolon-separated numbers
-                numbers = str(msg['number']).split(';')
-                primary_number = numbers[0].strip() if numbers else str(msg['number'])
-                try:
-                    customer_number = str(round(float(primary_number)))
-                    # Create readable data for retried messages
-                    customer_data = {
-                        'Name': msg['name'],
-                        'Amount': str(msg['amount']),
-                        'Cycle': msg['cycle'],
-                        'Status': 'unpaid'  # Assuming unpaid since we're sending a reminder
-                    }
-                    self.update_reminder_history(customer_number, customer_data)
-                except (ValueError, TypeError):
-                    logging.warning(f"Could not process number for reminder history: {primary_number}")
+                self.metrics.increment('reminders_planned')
+                return 'planned'
+            return 'invalid_number'
+        self.metrics.increment('reminders_skipped')
+        if self._log_decision():
+            logging.info("Skipping reminder for %s - recent reminder with no data change", row['Name'])
+        return 'skipped'
 
     def generate_report(self) -> None:
         """Generate and send summary report"""
-        report = self._create_report_message()
+        with self.metrics.timer('generate_report'):
+            self._generate_report()
+
+    def _generate_report(self) -> None:
         report_file = f"report_{datetime.now().strftime('%Y%m%d')}.txt"
         
         try:
-            # Send report to all admin numbers
-            for admin_phone in self.config['admin_phones']:
-                pywhatkit.sendwhatmsg_instantly(
-                    admin_phone,
-                    report,
-                    15,
-                    True,
-                    3
-                )
-                logging.info(f"Summary report sent successfully to {admin_phone}")
-                time.sleep(5)  # Add delay between messages
-            
-            # Save report to a file
+            # Save report to a file first, so it is kept even if sending fails
             with open(report_file, 'w') as f:
-                f.write(report)
-                
-                # Add failed messages to report file
-                if self.failed_messages:
-                    f.write("\n\nFailed Messages:\n")
-                    for msg in self.failed_messages:
-                        f.write(f"\n{msg['name']} ({msg['number']}): {msg['error']}")
-                
-                # Add paid smartcards to report file
-                if self.paid_smartcards:
-                    f.write("\n\nPaid Customer Smartcards:\n")
-                    f.write("----------------------------------------\n")
-                    f.write(f"{','.join(self.paid_smartcards)}\n")
-                    f.write("----------------------------------------\n")
-                
-                # Add inactive customers to report file
-                if self.inactive_customers:
-                    f.write("\n\nInactive Customers to Deactivate:\n")
-                    f.write("----------------------------------------\n")
-                    for customer in self.inactive_customers:
-                        f.write(f"\nName: {customer['name']}, Phone: {customer['number']}\n")
-                        f.write(f"Smartcard Numbers: {','.join(customer['smartcards'])}\n")
-                        f.write("----------------------------------------\n")
-                    
-                    # Add a simple comma-separated list of inactive smartcards
-                    f.write("\nAll Inactive Smartcards (Comma-separated):\n")
-                    f.write("----------------------------------------\n")
-                    all_inactive_smartcards = []
-                    for customer in self.inactive_customers:
-                        all_inactive_smartcards.extend(customer['smartcards'])
-                    f.write(f"{','.join(all_inactive_smartcards)}\n")
-                    f.write("----------------------------------------\n")
-            
+                messages = self.build_report_messages(f, report_file)
             logging.info(f"Report saved to {report_file}")
             
+            # Send report to all admin numbers at once; the parts for one admin go out in order
+            for admin_phone in self.config['admin_phones']:
+                for part in messages:
+                    self.delivery.submit({'phone': admin_phone, 'message': part})
+            for result in self.delivery.flush():
+                self.metrics.observe('report_send', result['latency'])
+                if result['success']:
+                    logging.info(f"Summary report sent successfully to {result['phone']}")
+                else:
+                    logging.error(f"Error sending summary report to {result['phone']}: {result['error']}")
+            
         except Exception as e:
             logging.error(f"Error sending summary report: {str(e)}")
 
-    def _create_report_message(self) -> str:
-        """Create formatted report message"""
+    def build_report_messages(self, f, report_file: str) -> List[str]:
+        """Write the report to f and return it split into the messages sent to each admin"""
+        report, compact_report = self._write_report(f)
+        messages = self._split_message(report, self.config['delivery']['max_message_chars'])
+        if len(messages) > self.config['delivery']['max_report_messages']:
+            # Too many parts to send: point to the report file for the smartcard lists instead
+            note = f"\n\nFull smartcard lists are in {report_file} ({len(messages)} messages long)"
+            messages = self._split_message(compact_report + note, self.config['delivery']['max_message_chars'])
+        return messages
+
+    def _write_report(self, f) -> Tuple[str, str]:
+        """Write the report file and return the report message and a variant without smartcard lists
+
+        Each smartcard list is read and joined once, and per-customer details
+        of inactive customers are streamed to a spooled buffer on the way.
+        """
         online = self.stats['online']
         offline = self.stats['offline']
         
@@ -470,7 +975,7 @@ class PaymentReminder:
         total_collected = online['paid_amount'] + offline['paid_amount']
         total_pending = online['unpaid_amount'] + offline['unpaid_amount']
         
-        report = (
+        sections = [(
             f"\n\nDAILY COLLECTION REPORT {datetime.now().strftime('%Y-%m-%d')}\n"
             f"----------------------------------------\n"
             f"TOTAL CUSTOMERS: {online['total'] + offline['total']}\n"
@@ -487,55 +992,302 @@ class PaymentReminder:
             f"TOTAL EXPECTED: ₹{total_expected}\n"
             f"TOTAL COLLECTED: ₹{total_collected}\n"
             f"TOTAL PENDING: ₹{total_pending}"
-        )
+        )]
+        compact_sections = list(sections)
         
         # Add paid smartcards - include all of them without limit
-        if self.paid_smartcards:
-            report += f"\n\nPAID CUSTOMER SMARTCARDS to be paid on SCV: {len(self.paid_smartcards)}"
-            report += f"\n----------------------------------------"
-            report += f"\n{','.join(self.paid_smartcards)}"
-            report += f"\n----------------------------------------"
+        paid_cards = ','.join(self.paid_smartcards) if self.paid_smartcards else None
+        if paid_cards is not None:
+            header = f"\n\nPAID CUSTOMER SMARTCARDS to be paid on SCV: {len(self.paid_smartcards)}"
+            sections.append(f"{header}\n----------------------------------------\n{paid_cards}\n----------------------------------------")
+            compact_sections.append(header)
             
-        # Add inactive customers - only show smartcard numbers, not customer details
+        # Add inactive customers - only show smartcard numbers in the message, details go to the file
+        inactive_cards = None
+        inactive_details = tempfile.SpooledTemporaryFile(max_size=1 << 20, mode='w+')
         if self.inactive_customers:
             all_inactive_smartcards = []
             for customer in self.inactive_customers:
                 all_inactive_smartcards.extend(customer['smartcards'])
-                
-            # Skip individual customer details, only show all smartcard numbers
-            report += f"\n\nINACTIVE SMARTCARDS TO DEACTIVATE: {len(all_inactive_smartcards)}"
-            report += f"\n----------------------------------------"
-            report += f"\n{','.join(all_inactive_smartcards)}"
-            report += f"\n----------------------------------------"
+                inactive_details.write(f"\nName: {customer['name']}, Phone: {customer['number']}\n"
+                                       f"Smartcard Numbers: {','.join(customer['smartcards'])}\n"
+                                       "----------------------------------------\n")
+            inactive_cards = ','.join(all_inactive_smartcards)
+            header = f"\n\nINACTIVE SMARTCARDS TO DEACTIVATE: {len(all_inactive_smartcards)}"
+            sections.append(f"{header}\n----------------------------------------\n{inactive_cards}\n----------------------------------------")
+            compact_sections.append(header)
+
+        # Smartcards listed twice for a customer, or by several customers, need checking in the sheet
+        if self.customer_index is None:
+            header = "\n\nSMARTCARD ISSUES: not checked in streaming runs (python cli.py validate-sheet lists them)"
+            sections.append(header)
+            compact_sections.append(header)
+        smartcard_issues = self.customer_index.smartcard_issues() if self.customer_index is not None else []
+        if smartcard_issues:
+            header = f"\n\nSMARTCARD ISSUES TO CHECK: {len(smartcard_issues)}"
+            sections.append(f"{header}\n----------------------------------------\n" + '\n'.join(smartcard_issues)
+                            + "\n----------------------------------------")
+            compact_sections.append(header)
+
+        for section in self.report_sections:
+            sections.append(f"\n\n{section}")
+            compact_sections.append(f"\n\n{section}")
+        report = ''.join(sections)
+
+        f.write(report)
+        # Add failed messages to report file
+        if self.failed_messages:
+            f.write("\n\nFailed Messages:\n")
+            for msg in self.failed_messages:
+                f.write(f"\n{msg['name']} ({msg['number']}): {msg['error']}")
+        
+        # Add paid smartcards to report file
+        if paid_cards is not None:
+            f.write("\n\nPaid Customer Smartcards:\n")
+            f.write("----------------------------------------\n")
+            f.write(f"{paid_cards}\n")
+            f.write("----------------------------------------\n")
         
-        return report
+        # Add inactive customers to report file
+        if inactive_cards is not None:
+            f.write("\n\nInactive Customers to Deactivate:\n")
+            f.write("----------------------------------------\n")
+            inactive_details.seek(0)
+            shutil.copyfileobj(inactive_details, f)
+            
+            # Add a simple comma-separated list of inactive smartcards
+            f.write("\nAll Inactive Smartcards (Comma-separated):\n")
+            f.write("----------------------------------------\n")
+            f.write(f"{inactive_cards}\n")
+            f.write("----------------------------------------\n")
+        inactive_details.close()
+        
+        return report, ''.join(compact_sections)
+
+    def _split_message(self, message: str, limit: int) -> List[str]:
+        """Split a message into numbered parts of at most limit characters
 
-    def run(self) -> None:
-        """Main execution method"""
+        Parts break at line ends where possible and inside long lines (such as
+        smartcard lists) after a comma.
+        """
+        if len(message) <= limit:
+            return [message]
+        # Leave room for the "(part i/n)" prefix
+        limit -= 20
+        parts: List[str] = []
+        current = ''
+        for line in message.splitlines(keepends=True):
+            while line:
+                room = limit - len(current)
+                if len(line) <= room:
+                    current += line
+                    break
+                # The line does not fit: break it after the last comma that does, or start a new part
+                cut = line.rfind(',', 0, room)
+                if cut >= 0:
+                    current, line = current + line[:cut + 1], line[cut + 1:]
+                elif not current:
+                    current, line = line[:room], line[room:]
+                parts.append(current)
+                current = ''
+        if current:
+            parts.append(current)
+        return [f"(part {i}/{len(parts)})\n{part}" for i, part in enumerate(parts, 1)]
+
+    def run(self, incremental: bool = False, resume: bool = False, streaming: bool = False,
+            send_report: bool = True, send_reminders: bool = True) -> None:
+        """Main execution method
+
+        With incremental=True only rows that are new, edited or not yet processed
+        today are checked for reminders; stats still cover the whole sheet.
+        With resume=True messages left unsent by a killed run are delivered as
+        part of this run instead of being cancelled.
+        With streaming=True the sheet is read and processed in chunks, so memory
+        use does not grow with the number of rows.
+        With send_report=False the admin report is left to the caller, as the
+        shard coordinator sends one report for all shards.
+        With send_reminders=False the sheet is only read for the report and no
+        reminders are queued or recorded, e.g. for a report during quiet hours.
+        """
         try:
             logging.info("Starting payment reminder process")
-            df = self.get_customer_data()
-            
-            total_records = len(df)
-            for idx, row in df.iterrows():
-                self.process_customer(row)
-                if (idx + 1) % 10 == 0:
-                    logging.info(f"Processed {idx + 1}/{total_records} records")
-            
-            if self.failed_messages:
-                self.retry_failed_messages()
+            if resume:
+                self.send_queue.recover_in_flight()
+            else:
+                self.send_queue.cancel_unfinished(self.run_id)
+            if self.shard is not None:
+                with self.metrics.timer('group_phones'):
+                    self.phone_groups = self.group_phones(streaming)
+            if streaming:
+                # The index holds every smartcard of the sheet, which would undo the flat memory of streaming
+                self.customer_index = None
+                occurrences: Dict[str, int] = {}
+                chunks = self.iter_customer_chunks(self.config['streaming']['chunk_size'])
+                while True:
+                    with self.metrics.timer('get_customer_data'):
+                        chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    self.process_chunk(chunk, incremental, occurrences, send_reminders)
+                    # Park this chunk's dues on disk until every chunk is read
+                    self.stage_planned_reminders()
+            else:
+                with self.metrics.timer('get_customer_data'):
+                    df = self.get_customer_data()
+                self.process_chunk(df, incremental, plan_reminders=send_reminders)
+
+            if send_reminders:
+                with self.metrics.timer('queue_planned_reminders'):
+                    self.queue_planned_reminders()
+                with self.metrics.timer('deliver_queued_messages'):
+                    self.deliver_queued_messages()
                 
-            self.generate_report()
+            if send_report:
+                self.generate_report()
             
             # Save reminder history after successful run
             self._save_reminder_history()
+            if send_reminders:
+                self.save_row_fingerprints()
+            self.commit_outcomes()
             
             logging.info("Payment reminder process completed successfully")
             
         except Exception as e:
             logging.error(f"Error in main execution: {str(e)}")
+            if self.outcomes is not None:
+                self.outcomes.discard()
             raise
+        finally:
+            self.write_run_profile()
+
+    def plan(self, incremental: bool = False) -> Dict:
+        """Work out what run() would send today without sending or recording anything
+
+        The sheet is classified and every reminder check is made as in a real
+        run, but nothing goes to the transport, the send queue, the reminder
+        history, the row fingerprints or the analytics store, and no report file
+        is written. Returns the recipients with their rendered messages, the
+        report messages, the stats and an estimate of the delivery time at the
+        current send rate.
+        """
+        self.reset_run_state()
+        try:
+            with self.metrics.timer('get_customer_data'):
+                df = self.get_customer_data()
+            self.process_chunk(df, incremental)
+
+            reminders = []
+            already_sent = 0
+            for phone, dues in self.planned_reminders.items():
+                job = {'phone': phone, 'message': self.templates.render_reminder(dues), 'customers': dues}
+                # The queue would drop a message identical to one delivered earlier today
+                if self.send_queue.was_sent(job):
+                    already_sent += 1
+                    continue
+                reminders.append({
+                    'phone': phone,
+                    'customers': [{key: due[key] for key in ('name', 'number', 'amount', 'cycle', 'customer_number')}
+                                  for due in dues],
+                    'message': job['message']
+                })
+
+            report_file = f"report_{datetime.now().strftime('%Y%m%d')}.txt"
+            report_messages = self.build_report_messages(io.StringIO(), report_file)
+            admins = self.config['admin_phones']
+            reminder_seconds = self.delivery.estimate_seconds(len(reminders))
+            report_seconds = self.delivery.estimate_seconds(len(admins) * len(report_messages))
+            return {
+                'date': datetime.now().strftime('%Y-%m-%d'),
+                'sheet': self.config['excel_path'],
+                'incremental': incremental,
+                'stats': self.stats,
+                'reminders': reminders,
+                'reminders_skipped': self.metrics.counters.get('reminders_skipped', 0),
+                'already_sent_today': already_sent,
+                'invalid_numbers': [{'name': msg['name'], 'number': msg['number']} for msg in self.failed_messages],
+                'report': {'admins': admins, 'messages': report_messages},
+                'estimated_seconds': {
+                    'reminders': round(reminder_seconds, 1),
+                    'report': round(report_seconds, 1),
+                    'total': round(reminder_seconds + report_seconds, 1)
+                }
+            }
+        finally:
+            # Nothing from the plan may be mistaken for a real run later
+            self.row_fingerprints.discard_staged()
+            self.reset_run_state()
+
+    def validate_sheet(self) -> Dict:
+        """Check the sheet for cells the run would skip or guess at, without planning any reminders
+
+        Raises ValueError if a required column is missing. Returns the number
+        of rows, the optional columns not found and one list per kind of problem.
+        """
+        self.reset_run_state()
+        df = self.get_customer_data()
+        classified = self.classify_customers(df)
+        self.index_customers(classified)
+        counted = classified[classified['_counted']]
+        names = classified['Name'].fillna('Unknown').astype(str)
+        mode = counted['Mode'].astype(str).str.lower().str.strip()
+        unknown_modes = mode[(counted['_mode'] == 'offline') & (mode != 'offline')]
+        invalid_amounts = counted.index[pd.to_numeric(counted['Amount'], errors='coerce').isna()]
+        with_number = classified[classified['_has_number']]
+        result = {
+            'sheet': self.config['excel_path'],
+            'rows': len(df),
+            'missing_optional_columns': [col for col in USED_COLUMNS
+                                         if col not in REQUIRED_COLUMNS and col not in df.columns],
+            'missing_numbers': names[~classified['_has_number']].tolist(),
+            'invalid_numbers': [f"{name}: {number}"
+                                for name, numbers in zip(names[with_number.index], with_number['_invalid_numbers'])
+                                for number in numbers],
+            'invalid_amounts': names[invalid_amounts].tolist(),
+            'unknown_modes': {str(value): int(count) for value, count in unknown_modes.value_counts().items()},
+            'smartcard_issues': self.customer_index.smartcard_issues()
+        }
+        self.reset_run_state()
+        return result
+
+    def commit_outcomes(self) -> None:
+        """Add this run's customer outcomes and delivery results to the analytics store"""
+        if self.outcomes is None:
+            return
+        name = self.run_id if self.shard is None else f"{self.run_id}-shard{self.shard[0]}"
+        try:
+            with self.metrics.timer('commit_outcomes'):
+                rows = self.outcomes.commit(name, self._run_date.strftime('%Y-%m'))
+            logging.info(f"Recorded {rows} outcome rows in {self.config['analytics']['path']}")
+        except Exception as e:
+            # Analytics are best effort; a failed write does not fail the run
+            logging.error(f"Error recording run outcomes: {str(e)}")
+
+    def write_run_profile(self) -> None:
+        """Write the run's timings and counters to the profile and exporter files"""
+        self.metrics.write_profile(self.config['metrics']['profile_dir'])
+        exporter_path = self.config['metrics']['exporter_path']
+        if exporter_path:
+            self.metrics.write_exporter_file(exporter_path, self.config['metrics']['exporter_format'])
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send WhatsApp payment reminders and the daily report")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only process rows that changed since the last run today")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue a run that was killed, delivering its unsent messages")
+    parser.add_argument('--stream', action='store_true',
+                        help="read and process the sheet in chunks to keep memory flat on very large sheets")
+    parser.add_argument('--plan', action='store_true',
+                        help="print what would be sent today without sending or recording anything")
+    parser.add_argument('--plan-file',
+                        help="with --plan, also write the full plan with every message to this JSON file")
+    args = parser.parse_args()
+
     reminder = PaymentReminder()
-    reminder.run()
+    if args.plan:
+        from cli import print_plan
+        print_plan(reminder.plan(incremental=args.incremental), args.plan_file)
+        reminder.close()
+    else:
+        reminder.run(incremental=args.incremental, resume=args.resume, streaming=args.stream)
@@ -0,0 +1,304 @@
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Sequence, Union
+
+import pandas as pd
+
+# Column types of each dataset; every file of a dataset is written with these columns in this order
+SCHEMAS = {
+    'outcomes': {
+        'run_id': 'str',
+        'run_date': 'datetime64[ns]',
+        'customer_number': 'str',
+        'name': 'str',
+        'mode': 'str',
+        'amount': 'float64',
+        # paid, unpaid, inactive or skip_until
+        'status': 'str',
+        # planned, skipped, invalid_number, unchanged (incremental run) or empty when not checked
+        'reminder': 'str',
+    },
+    'deliveries': {
+        'run_id': 'str',
+        'run_date': 'datetime64[ns]',
+        'customer_number': 'str',
+        'phone': 'str',
+        # sent, or failed once the send queue gave up
+        'result': 'str',
+        'attempts': 'int64',
+        'latency': 'float64',
+    },
+}
+AGE_BUCKETS = [(0, 30, '0-30 days'), (31, 60, '31-60 days'), (61, 90, '61-90 days'), (91, None, 'over 90 days')]
+
+
+def parquet_available() -> bool:
+    return any(importlib.util.find_spec(engine) is not None for engine in ('pyarrow', 'fastparquet'))
+
+
+class OutcomeStore:
+    """Append-only store of per-customer run outcomes, partitioned by month
+
+    Files live under <path>/<dataset>/month=YYYY-MM/, one or more per run,
+    so a query over a few months only opens those months' files and only
+    reads the columns it needs. During a run, rows are staged in a private
+    directory and only moved into the partitions by commit(), so a failed
+    run leaves nothing behind.
+    """
+
+    def __init__(self, path: str = 'analytics', file_format: str = 'auto', rows_per_file: int = 100000):
+        if file_format == 'auto':
+            file_format = 'parquet' if parquet_available() else 'csv'
+        if file_format not in ('parquet', 'csv'):
+            raise ValueError(f"Unknown analytics format: {file_format}")
+        if file_format == 'parquet' and not parquet_available():
+            raise ValueError("The parquet analytics format needs pyarrow or fastparquet installed")
+        self.path = path
+        self.file_format = file_format
+        self.rows_per_file = rows_per_file
+        self.staging_dir: Optional[str] = None
+        self.buffers: Dict[str, List[pd.DataFrame]] = {}
+        self.records: Dict[str, List[Dict]] = {}
+        self.buffered_rows: Dict[str, int] = {}
+        self.staged_files: List[str] = []
+        self.staged_rows = 0
+
+    def stage(self, dataset: str, rows: Union[pd.DataFrame, List[Dict]]) -> None:
+        """Buffer rows (a frame or a list of dicts) until commit(), spilling large buffers to staging files"""
+        if isinstance(rows, pd.DataFrame):
+            self.buffers.setdefault(dataset, []).append(rows)
+        else:
+            self.records.setdefault(dataset, []).extend(rows)
+        self.buffered_rows[dataset] = self.buffered_rows.get(dataset, 0) + len(rows)
+        self.staged_rows += len(rows)
+        if self.buffered_rows[dataset] >= self.rows_per_file:
+            self._write_buffer(dataset)
+
+    def _write_buffer(self, dataset: str) -> None:
+        blocks = [block for block in self.buffers.pop(dataset, []) if len(block)]
+        records = self.records.pop(dataset, [])
+        if records:
+            blocks.append(pd.DataFrame(records))
+        self.buffered_rows.pop(dataset, None)
+        if not blocks:
+            return
+        schema = SCHEMAS[dataset]
+        frame = pd.concat(blocks, ignore_index=True).reindex(columns=list(schema)).astype(schema)
+        if self.staging_dir is None:
+            os.makedirs(os.path.join(self.path, '_staging'), exist_ok=True)
+            self.staging_dir = tempfile.mkdtemp(dir=os.path.join(self.path, '_staging'))
+        staged = os.path.join(self.staging_dir, f"{dataset}-{len(self.staged_files)}.{self.file_format}")
+        if self.file_format == 'parquet':
+            frame.to_parquet(staged, index=False)
+        else:
+            frame.to_csv(staged, index=False, date_format='%Y-%m-%d')
+        self.staged_files.append(staged)
+
+    def commit(self, name: str, month: str) -> int:
+        """Move everything staged into the month's partitions as files named after name; returns the row count"""
+        rows = self.staged_rows
+        for dataset in sorted(set(self.buffers) | set(self.records)):
+            self._write_buffer(dataset)
+        for index, staged in enumerate(self.staged_files):
+            dataset, extension = os.path.basename(staged).split('-')[0], os.path.splitext(staged)[1]
+            partition = os.path.join(self.path, dataset, f"month={month}")
+            os.makedirs(partition, exist_ok=True)
+            os.replace(staged, os.path.join(partition, f"{name}-{index}{extension}"))
+        self.staged_files = []
+        self.discard()
+        return rows
+
+    def discard(self) -> None:
+        """Drop staged rows that were not committed"""
+        self.buffers = {}
+        self.records = {}
+        self.buffered_rows = {}
+        self.staged_files = []
+        self.staged_rows = 0
+        if self.staging_dir is not None:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            self.staging_dir = None
+
+    def files(self, dataset: str, since: Optional[str] = None, until: Optional[str] = None) -> List[str]:
+        """Return the files of the months from since to until (YYYY-MM, inclusive)"""
+        root = os.path.join(self.path, dataset)
+        if not os.path.isdir(root):
+            return []
+        files = []
+        for partition in sorted(os.listdir(root)):
+            month = partition.partition('=')[2]
+            if (since and month < since) or (until and month > until):
+                continue
+            directory = os.path.join(root, partition)
+            files.extend(os.path.join(directory, name) for name in sorted(os.listdir(directory)))
+        return files
+
+    def read(self, dataset: str, columns: Optional[Sequence[str]] = None,
+             since: Optional[str] = None, until: Optional[str] = None) -> pd.DataFrame:
+        """Read the given columns of a dataset for the months from since to until"""
+        schema = SCHEMAS[dataset]
+        columns = list(columns or schema)
+        frames = []
+        for path in self.files(dataset, since, until):
+            if path.endswith('.parquet'):
+                frames.append(pd.read_parquet(path, columns=columns))
+            elif path.endswith('.csv'):
+                frames.append(pd.read_csv(
+                    path, usecols=columns, keep_default_na=False,
+                    dtype={column: kind for column, kind in schema.items() if column in columns and column != 'run_date'}
+                ))
+        if not frames:
+            return pd.DataFrame({column: pd.Series(dtype=schema[column]) for column in columns})
+        frame = pd.concat(frames, ignore_index=True)
+        if 'run_date' in frame.columns:
+            frame['run_date'] = pd.to_datetime(frame['run_date'])
+        return frame
+
+
+def daily_snapshots(store: OutcomeStore, since: Optional[str] = None, until: Optional[str] = None) -> pd.DataFrame:
+    """Return the outcome rows of each customer's latest run of every day
+
+    A day with several runs (daemon passes, or a re-run after an edit) counts
+    once per customer, as the sheet looked at that customer's last run.
+    """
+    outcomes = store.read('outcomes', ['run_id', 'run_date', 'customer_number', 'mode', 'amount', 'status'],
+                          since, until)
+    # Run ids sort by start time; comparing their ranks is much faster than comparing the strings
+    run_rank = pd.Series(pd.factorize(outcomes['run_id'], sort=True)[0], index=outcomes.index)
+    latest = run_rank.groupby([outcomes['run_date'], outcomes['customer_number']]).transform('max')
+    return outcomes[run_rank == latest]
+
+
+def _customer_days(snapshots: pd.DataFrame) -> pd.DataFrame:
+    """Collapse snapshots to one row per day and customer with their unpaid rows and amount"""
+    counted = snapshots[snapshots['status'].isin(['paid', 'unpaid'])]
+    unpaid = counted['status'] == 'unpaid'
+    return pd.DataFrame({
+        'run_date': counted['run_date'],
+        'customer_number': counted['customer_number'],
+        'unpaid_rows': unpaid.astype(int),
+        'unpaid_amount': counted['amount'].where(unpaid, 0.0),
+    }).groupby(['run_date', 'customer_number'], as_index=False).sum()
+
+
+def collection_rate(snapshots: pd.DataFrame) -> pd.DataFrame:
+    """Expected, collected and pending amounts per month, as of the last day with a run in the month"""
+    counted = snapshots[snapshots['status'].isin(['paid', 'unpaid'])]
+    if counted.empty:
+        return pd.DataFrame(columns=['as_of', 'customers', 'paid', 'expected', 'collected', 'pending',
+                                     'collection_rate', 'online_rate', 'offline_rate'])
+    month = counted['run_date'].dt.to_period('M')
+    last_day = counted['run_date'].groupby(month).transform('max')
+    counted = counted[counted['run_date'] == last_day]
+    paid = counted['status'] == 'paid'
+    frame = pd.DataFrame({
+        'month': counted['run_date'].dt.to_period('M'),
+        'as_of': counted['run_date'].dt.date,
+        'mode': counted['mode'],
+        'paid': paid,
+        'expected': counted['amount'],
+        'collected': counted['amount'].where(paid, 0.0),
+    })
+    summary = frame.groupby('month').agg(
+        as_of=('as_of', 'first'),
+        customers=('paid', 'size'),
+        paid=('paid', 'sum'),
+        expected=('expected', 'sum'),
+        collected=('collected', 'sum'),
+    )
+    summary['pending'] = summary['expected'] - summary['collected']
+    summary['collection_rate'] = (summary['collected'] / summary['expected'] * 100).round(1)
+    by_mode = frame.groupby(['month', 'mode'])[['collected', 'expected']].sum()
+    mode_rate = (by_mode['collected'] / by_mode['expected'] * 100).round(1).unstack('mode')
+    for mode in ('online', 'offline'):
+        summary[f"{mode}_rate"] = mode_rate[mode] if mode in mode_rate.columns else float('nan')
+    summary.index = summary.index.astype(str)
+    return summary
+
+
+def unpaid_ageing(snapshots: pd.DataFrame) -> pd.DataFrame:
+    """Customers and amounts unpaid on the latest day, by how long they have been unpaid without a break"""
+    days = _customer_days(snapshots)
+    buckets = pd.DataFrame({'customers': 0, 'amount': 0.0}, index=[label for _, _, label in AGE_BUCKETS])
+    buckets.index.name = 'unpaid_for'
+    if days.empty:
+        return buckets
+    latest = days['run_date'].max()
+    unpaid_now = days[(days['run_date'] == latest) & (days['unpaid_rows'] > 0)]
+    # A streak starts on the first unpaid day after the customer's last fully paid day
+    last_settled = days[days['unpaid_rows'] == 0].groupby('customer_number', as_index=False)['run_date'].max()
+    unpaid_days = days[(days['unpaid_rows'] > 0) & days['customer_number'].isin(unpaid_now['customer_number'])].merge(
+        last_settled.rename(columns={'run_date': 'last_settled'}), on='customer_number', how='left')
+    streak = unpaid_days[unpaid_days['last_settled'].isna() | (unpaid_days['run_date'] > unpaid_days['last_settled'])]
+    unpaid_since = streak.groupby('customer_number', as_index=False)['run_date'].min()
+    unpaid_now = unpaid_now.merge(unpaid_since.rename(columns={'run_date': 'unpaid_since'}), on='customer_number')
+    age = (latest - unpaid_now['unpaid_since']).dt.days
+    for low, high, label in AGE_BUCKETS:
+        in_bucket = (age >= low) & (age <= high if high is not None else True)
+        buckets.loc[label, 'customers'] = int(in_bucket.sum())
+        buckets.loc[label, 'amount'] = float(unpaid_now.loc[in_bucket, 'unpaid_amount'].sum())
+    return buckets
+
+
+def reminder_effectiveness(store: OutcomeStore, snapshots: pd.DataFrame, window_days: int = 7,
+                           since: Optional[str] = None, until: Optional[str] = None) -> pd.DataFrame:
+    """Share of delivered reminders per month after which the customer paid within window_days
+
+    A customer counts as having paid on the first later day on which none of
+    their rows is unpaid.
+    """
+    deliveries = store.read('deliveries', ['run_date', 'customer_number', 'result'], since, until)
+    reminded = deliveries.loc[deliveries['result'] == 'sent', ['run_date', 'customer_number']].drop_duplicates()
+    columns = ['reminded', 'paid_within_window', 'effectiveness', 'median_days_to_pay']
+    if reminded.empty:
+        return pd.DataFrame(columns=columns)
+    days = _customer_days(snapshots)
+    settled = days.loc[days['unpaid_rows'] == 0, ['run_date', 'customer_number']].rename(
+        columns={'run_date': 'paid_date'})
+    matched = pd.merge_asof(
+        reminded.sort_values('run_date'), settled.sort_values('paid_date'),
+        left_on='run_date', right_on='paid_date', by='customer_number',
+        direction='forward', allow_exact_matches=False
+    )
+    matched['days_to_pay'] = (matched['paid_date'] - matched['run_date']).dt.days
+    matched['paid_within_window'] = matched['days_to_pay'] <= window_days
+    summary = matched.groupby(matched['run_date'].dt.to_period('M').rename('month')).agg(
+        reminded=('customer_number', 'size'),
+        paid_within_window=('paid_within_window', 'sum'),
+        median_days_to_pay=('days_to_pay', 'median'),
+    )
+    summary['effectiveness'] = (summary['paid_within_window'] / summary['reminded'] * 100).round(1)
+    summary.index = summary.index.astype(str)
+    return summary[columns]
+
+
+def load_store(config_path: str) -> OutcomeStore:
+    """Open the store at the analytics path of a PaymentReminder config file"""
+    with open(config_path, 'r') as f:
+        analytics = json.load(f).get('analytics', {})
+    return OutcomeStore(analytics.get('path', 'analytics'), analytics.get('format', 'auto'))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trend reports over the outcomes of past reminder runs")
+    parser.add_argument('report', choices=['collection', 'ageing', 'effectiveness', 'all'])
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--since', help="first month to include (YYYY-MM)")
+    parser.add_argument('--until', help="last month to include (YYYY-MM)")
+    parser.add_argument('--window-days', type=int, default=7,
+                        help="a reminder counts as effective if the customer paid within this many days")
+    args = parser.parse_args()
+
+    store = load_store(args.config)
+    snapshots = daily_snapshots(store, args.since, args.until)
+    if args.report in ('collection', 'all'):
+        print("COLLECTION RATE BY MONTH (%)\n" + collection_rate(snapshots).to_string() + "\n")
+    if args.report in ('ageing', 'all'):
+        print("UNPAID DUES BY AGE\n" + unpaid_ageing(snapshots).to_string() + "\n")
+    if args.report in ('effectiveness', 'all'):
+        effectiveness = reminder_effectiveness(store, snapshots, args.window_days, args.since, args.until)
+        print(f"REMINDERS PAID WITHIN {args.window_days} DAYS (%)\n" + effectiveness.to_string() + "\n")
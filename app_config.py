@@ -0,0 +1,124 @@
+"""Reading and validating config.json
+
+Kept free of pandas and the other heavy imports, so commands that only need
+the config (python cli.py check-config, history) start quickly.
+"""
+import json
+import logging
+from typing import Dict
+
+from metrics import EXPORTER_FORMATS
+
+
+def load_config(path: str = 'config.json') -> Dict:
+    """Load a config file and fill in the defaults"""
+    with open(path, 'r') as f:
+        config = json.load(f)
+    validate_config(config)
+    return config
+
+
+def validate_config(config: Dict) -> None:
+    """Check the required fields and fill in defaults, in place"""
+    required_fields = ['excel_path', 'admin_phones', 'sheet_name']
+    for field in required_fields:
+        if field not in config:
+            raise ValueError(f"Missing required config field: {field}")
+
+    # Convert to list if it's a string
+    if isinstance(config['admin_phones'], str):
+        config['admin_phones'] = [config['admin_phones']]
+
+    # Ensure all phone numbers start with +
+    for i, phone in enumerate(config['admin_phones']):
+        if not phone.startswith('+'):
+            config['admin_phones'][i] = f"+{phone}"
+
+    # Message text, payment details and per-language variants
+    config.setdefault('message_templates', {})
+
+    # Pending sends are checkpointed on disk and retried with exponential backoff
+    send_queue = config.setdefault('send_queue', {})
+    send_queue.setdefault('path', 'send_queue.db')
+    send_queue.setdefault('max_attempts', 3)
+    send_queue.setdefault('backoff_base_seconds', 5)
+    send_queue.setdefault('backoff_max_seconds', 300)
+    send_queue.setdefault('batch_size', 100)
+
+    # History is kept in SQLite and migrated from reminder_history.json on first use
+    config.setdefault('history_backend', 'sqlite')
+    config.setdefault('history_path', 'reminder_history.db')
+    config.setdefault('history_json_path', 'reminder_history.json')
+    # Row fingerprints of incremental runs; the shard coordinator gives every shard its own file
+    config.setdefault('fingerprint_path', config['history_path'])
+
+    # Chunked reading of very large sheets (python PaymentReminder.py --stream)
+    streaming = config.setdefault('streaming', {})
+    streaming.setdefault('chunk_size', 5000)
+    streaming.setdefault('spill_threshold', 100000)
+
+    # Run profiles are always written; the exporter file only when a path is set
+    metrics = config.setdefault('metrics', {})
+    metrics.setdefault('profile_dir', 'profiles')
+    metrics.setdefault('exporter_path', None)
+    metrics.setdefault('exporter_format', 'prometheus')
+    if metrics['exporter_format'] not in EXPORTER_FORMATS:
+        raise ValueError(f"Unknown metrics.exporter_format: {metrics['exporter_format']} "
+                         f"(expected one of {', '.join(EXPORTER_FORMATS)})")
+
+    # Logs are written by a background thread and rotated by size ('size'), by time ('time') or not at all (null)
+    log = config.setdefault('logging', {})
+    log.setdefault('path', 'payment_reminder.log')
+    log.setdefault('level', 'INFO')
+    log.setdefault('format', 'text')
+    log.setdefault('rotation', 'size')
+    log.setdefault('max_bytes', 5 * 1024 * 1024)
+    log.setdefault('backup_count', 5)
+    log.setdefault('when', 'midnight')
+
+    # Per-customer outcomes of every run, partitioned by month; Parquet if pyarrow is installed, else CSV
+    analytics = config.setdefault('analytics', {})
+    analytics.setdefault('enabled', True)
+    analytics.setdefault('path', 'analytics')
+    analytics.setdefault('format', 'auto')
+    analytics.setdefault('rows_per_file', 100000)
+
+    # Sheet headers to read as one of the used columns, e.g. {"Secondry Smartcard Number": ["Second card"]}
+    config.setdefault('column_aliases', {})
+    # Numbers without a country code are taken as national numbers of this country
+    phone_numbers = config.setdefault('phone_numbers', {})
+    phone_numbers.setdefault('country_code', '91')
+    phone_numbers.setdefault('national_digits', 10)
+
+    # Share of per-customer reminder decisions written to the log (1 = all, 0 = none)
+    config.setdefault('decision_log_sample_rate', 1)
+
+    # Cache of the projected sheet, reused while the source file is unchanged
+    config.setdefault('use_cache', True)
+    config.setdefault('cache_dir', '.customer_cache')
+
+    # Set default time difference if not provided
+    if 'time_difference_hours' not in config:
+        config['time_difference_hours'] = 24
+        logging.info("Using default time difference of 24 hours")
+
+    # Delivery defaults match the original serial pywhatkit behaviour
+    delivery = config.setdefault('delivery', {})
+    delivery.setdefault('backend', 'pywhatkit')
+    delivery.setdefault('concurrency', 1)
+    delivery.setdefault('per_destination_interval_seconds', 0)
+    delivery.setdefault('options', {})
+    # Adaptive pacing in messages per second; null takes the backend's default (pywhatkit paces itself
+    # from its options, other backends are unlimited unless a rate is set)
+    rate_limit = delivery.setdefault('rate_limit', {})
+    rate_limit.setdefault('rate', None)
+    rate_limit.setdefault('min_rate', None)
+    rate_limit.setdefault('max_rate', None)
+    rate_limit.setdefault('burst', 1)
+    rate_limit.setdefault('increase_factor', 1.05)
+    rate_limit.setdefault('decrease_factor', 0.5)
+    rate_limit.setdefault('slow_send_seconds', None)
+    # Reports longer than this are sent in parts; past max_report_messages parts the
+    # smartcard lists are left to the report file
+    delivery.setdefault('max_message_chars', 4000)
+    delivery.setdefault('max_report_messages', 10)
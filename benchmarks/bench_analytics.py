@@ -0,0 +1,84 @@
+"""Time the analytics queries over months of synthetic daily run outcomes
+
+Every simulated day is one committed run: customers pay with a small daily
+chance after their cycle starts on the 1st, and unpaid online customers are
+reminded each day.
+
+Usage: python benchmarks/bench_analytics.py [customers] [days]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from analytics import (OutcomeStore, collection_rate, daily_snapshots, reminder_effectiveness,
+                       unpaid_ageing)
+
+
+def write_history(store: OutcomeStore, customers: int, days: int, seed: int = 42) -> None:
+    rng = np.random.default_rng(seed)
+    numbers = pd.Series(9000000000 + np.arange(customers)).astype(str)
+    modes = np.where(rng.random(customers) < 0.7, 'online', 'offline')
+    amounts = rng.choice([300.0, 450.0, 560.0, 650.0], customers)
+    paid = np.zeros(customers, dtype=bool)
+    first_day = pd.Timestamp('2026-01-01')
+    for offset in range(days):
+        day = first_day + pd.Timedelta(days=offset)
+        if day.day == 1:
+            paid[:] = False
+        paid |= rng.random(customers) < 0.08
+        run_id = day.strftime('%Y%m%d') + '100000000000'
+        reminded = ~paid & (modes == 'online')
+        store.stage('outcomes', pd.DataFrame({
+            'run_id': run_id,
+            'run_date': day,
+            'customer_number': numbers,
+            'name': 'Customer',
+            'mode': modes,
+            'amount': amounts,
+            'status': np.where(paid, 'paid', 'unpaid'),
+            'reminder': np.where(reminded, 'planned', ''),
+        }))
+        store.stage('deliveries', pd.DataFrame({
+            'run_id': run_id,
+            'run_date': day,
+            'customer_number': numbers[reminded],
+            'phone': '+91' + numbers[reminded],
+            'result': 'sent',
+            'attempts': 1,
+            'latency': 0.0,
+        }))
+        store.commit(run_id, day.strftime('%Y-%m'))
+
+
+def main() -> None:
+    customers = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 180
+    store = OutcomeStore(tempfile.mkdtemp(prefix='bench_analytics_'))
+    start = time.perf_counter()
+    write_history(store, customers, days)
+    print(f"Wrote {customers * days:,} outcome rows ({days} runs, {store.file_format}) "
+          f"in {time.perf_counter() - start:.1f}s to {store.path}")
+
+    start = time.perf_counter()
+    snapshots = daily_snapshots(store)
+    print(f"read snapshots:         {time.perf_counter() - start:8.2f}s")
+    for name, query in (
+        ('collection rate', lambda: collection_rate(snapshots)),
+        ('unpaid ageing', lambda: unpaid_ageing(snapshots)),
+        ('reminder effectiveness', lambda: reminder_effectiveness(store, snapshots)),
+    ):
+        start = time.perf_counter()
+        result = query()
+        print(f"{name + ':':<24}{time.perf_counter() - start:8.2f}s")
+        print(result.to_string() + "\n")
+
+
+if __name__ == '__main__':
+    main()
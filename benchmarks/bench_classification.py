@@ -0,0 +1,223 @@
+"""Compare the per-row process_customer loop with the vectorized classification stage
+
+The per-row loop is the one run() used before classify_customers existed; it
+is kept here, and only here, as the reference for the comparison.
+
+Usage: python benchmarks/bench_classification.py [rows]
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from phone_numbers import parse_phone_cells
+from synthetic import PAYMENT_DETAILS, generate_customer_sheet
+
+
+def collect_smartcards(row: pd.Series, columns: List[str]) -> List[str]:
+    """Extract smartcard numbers from a customer row"""
+    smartcards = [str(row[col]).strip() for col in columns if col in row and pd.notna(row[col])]
+    return [card for card in smartcards if card]  # Filter out empty strings
+
+
+def process_customer(reminder, row: pd.Series, constants: Dict, occurrences: Dict[str, int]) -> None:
+    """The per-row path run() took for every row before the vectorized classification
+
+    constants holds the status, mode and smartcard column lists of PaymentReminder;
+    occurrences counts the rows seen per history key, as history_keys() does.
+    """
+    # Check for missing or NaN phone number
+    if pd.isna(row.get('Number')):
+        logging.warning("Skipping customer with missing phone number: %s", row.get('Name', 'Unknown'))
+        return
+
+    # History key: primary number without the country code and the name, '#n' for repeated pairs
+    phone_config = reminder.config['phone_numbers']
+    phones, invalid, customer_number = parse_phone_cells(
+        [row['Number']], phone_config['country_code'], phone_config['national_digits'])[row['Number']]
+    history_key = f"{customer_number}:{' '.join(str(row['Name']).split())}"
+    occurrence = occurrences.get(history_key, 0)
+    occurrences[history_key] = occurrence + 1
+    if occurrence:
+        history_key = f"{history_key}#{occurrence}"
+
+    # Check if customer is inactive - do this early to exclude from calculations
+    is_inactive = False
+    status = str(row['Status']).lower().strip()
+
+    # Check Status column
+    if status.lower() in constants['INACTIVE_STATUSES']:
+        is_inactive = True
+
+    # Also check Customer Status column if it exists
+    if 'Customer Status' in row and pd.notna(row['Customer Status']):
+        customer_status = str(row['Customer Status']).lower().strip()
+        if customer_status in constants['INACTIVE_CUSTOMER_STATUSES']:
+            is_inactive = True
+            logging.info("Found inactive customer via Customer Status column: %s", row['Name'])
+
+    # Collect smartcard numbers for inactive customers but exclude from stats
+    if is_inactive:
+        smartcards = collect_smartcards(row, constants['SMARTCARD_COLUMNS'])
+        reminder.inactive_customers.append({
+            'name': row['Name'],
+            'number': row['Number'],
+            'smartcards': smartcards if smartcards else ['No smartcard']
+        })
+        logging.info("Added inactive customer for deactivation: %s with smartcards: %s", row['Name'], smartcards)
+        return  # Skip the rest of processing for inactive customers
+
+    # Check if reminder should be skipped based on SkipUntil column
+    if 'SkipUntil' in row and pd.notna(row['SkipUntil']):
+        try:
+            # Try to parse the date - should be in DD/MM/YYYY format
+            skip_until_date = pd.to_datetime(row['SkipUntil'], format='%d/%m/%Y').date()
+            current_date = datetime.now().date()
+
+            if current_date <= skip_until_date:
+                logging.info("Skipping reminder for %s until %s", row.get('Name', 'Unknown'), skip_until_date)
+                return
+        except Exception as e:
+            logging.warning("Invalid date format in SkipUntil for %s: %s", row.get('Name', 'Unknown'), e)
+
+    mode = str(row['Mode']).lower().strip()
+    original_mode = row['Mode']  # Keep original mode for message customization
+    if mode in constants['ONLINE_MODES']:
+        mode = 'online'
+    elif mode not in ['online', 'offline']:
+        logging.warning("Unknown payment mode '%s' for customer %s, defaulting to offline", mode, row['Name'])
+        mode = 'offline'
+
+    # Handle missing or non-numeric amount values
+    try:
+        if pd.isna(row['Amount']):
+            amount = 0
+            logging.warning("Missing amount for customer %s, using 0", row['Name'])
+        else:
+            amount = float(row['Amount'])
+    except (ValueError, TypeError):
+        logging.warning("Invalid amount format for customer %s, using 0", row['Name'])
+        amount = 0
+
+    if invalid:
+        logging.warning("Invalid phone number format for %s: %s", row.get('Name', 'Unknown'), ', '.join(invalid))
+
+    customer_data = reminder._get_customer_data(dict(row, _amount=amount))
+
+    # Get smartcard numbers for this customer
+    smartcards = collect_smartcards(row, constants['SMARTCARD_COLUMNS'])
+
+    # Update statistics
+    reminder.stats[mode]['total'] += 1
+    if status == 'paid':
+        reminder.stats[mode]['paid'] += 1
+        reminder.stats[mode]['paid_amount'] += amount
+
+        # Add smartcards from paid customers to the paid_smartcards list
+        reminder.paid_smartcards.extend(smartcards)
+
+    else:
+        reminder.stats[mode]['unpaid_amount'] += amount
+        if mode == 'online':
+            # Check if we should send a reminder
+            if reminder.should_send_reminder(history_key, customer_data):
+                # History is updated once the delivery engine reports success
+                reminder.plan_reminder(
+                    phones,
+                    invalid,
+                    row['Name'],
+                    amount,
+                    row['Cycle'],
+                    original_mode,  # Pass the original mode to customize the message
+                    customer_number,
+                    customer_data,
+                    reminder.templates.language_for(row.get('Language')),
+                    history_key
+                )
+            else:
+                logging.info("Skipping reminder for %s - recent reminder with no data change", row['Name'])
+
+
+def queued_history_keys(reminder) -> List[str]:
+    """Return the sorted history keys of the customers in the run's queued messages"""
+    return sorted(
+        customer['history_key']
+        for (payload,) in reminder.send_queue.connection.execute(
+            'SELECT payload FROM send_queue WHERE run_id = ?', (reminder.run_id,))
+        for customer in json.loads(payload)['customers']
+    )
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    workdir = tempfile.mkdtemp(prefix='bench_classification_')
+    # Each path gets its own directory so they do not share history or send queue
+    for name in ('legacy', 'vectorized'):
+        os.makedirs(os.path.join(workdir, name))
+        with open(os.path.join(workdir, name, 'config.json'), 'w') as f:
+            json.dump({
+                'excel_path': 'CustomerData.xlsx',
+                'sheet_name': 'CustomerData',
+                'admin_phones': ['+910000000000'],
+                'message_templates': {'payment_details': PAYMENT_DETAILS},
+                'delivery': {'backend': 'fake'}
+            }, f)
+    os.chdir(workdir)
+
+    # Imported after chdir so the log file lands in the scratch directory
+    from PaymentReminder import (INACTIVE_CUSTOMER_STATUSES, INACTIVE_STATUSES, ONLINE_MODES,
+                                 SMARTCARD_COLUMNS, PaymentReminder)
+    constants = {
+        'INACTIVE_STATUSES': INACTIVE_STATUSES,
+        'INACTIVE_CUSTOMER_STATUSES': INACTIVE_CUSTOMER_STATUSES,
+        'ONLINE_MODES': ONLINE_MODES,
+        'SMARTCARD_COLUMNS': SMARTCARD_COLUMNS,
+    }
+
+    df = generate_customer_sheet(rows)
+    print(f"Synthetic sheet: {rows} rows (scratch dir {workdir})")
+
+    os.chdir(os.path.join(workdir, 'legacy'))
+    legacy = PaymentReminder()
+    occurrences: Dict[str, int] = {}
+    start = time.perf_counter()
+    for _, row in df.iterrows():
+        process_customer(legacy, row, constants, occurrences)
+    legacy.queue_planned_reminders()
+    legacy_time = time.perf_counter() - start
+
+    os.chdir(os.path.join(workdir, 'vectorized'))
+    vectorized = PaymentReminder()
+    start = time.perf_counter()
+    candidates = vectorized.apply_classification(vectorized.classify_customers(df))
+    for row in candidates.to_dict('records'):
+        vectorized.remind_customer(row)
+    vectorized.queue_planned_reminders()
+    vectorized_time = time.perf_counter() - start
+
+    print(f"iterrows + process_customer: {legacy_time:8.2f}s ({rows / legacy_time:,.0f} rows/s)")
+    print(f"vectorized classification:   {vectorized_time:8.2f}s ({rows / vectorized_time:,.0f} rows/s)")
+    print(f"speedup: {legacy_time / vectorized_time:.1f}x")
+
+    consistent = (
+        legacy.stats == vectorized.stats
+        and list(legacy.paid_smartcards) == list(vectorized.paid_smartcards)
+        and len(legacy.inactive_customers) == len(vectorized.inactive_customers)
+        and legacy.send_queue.counts(legacy.run_id) == vectorized.send_queue.counts(vectorized.run_id)
+        and queued_history_keys(legacy) == queued_history_keys(vectorized)
+    )
+    print(f"results match: {consistent}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Run the whole reminder pipeline on synthetic sheets against the fake transport
+
+Each size runs in its own process and scratch directory, so peak RSS and the
+history/send queue start fresh every time. Stage timings come from the run
+profile that PaymentReminder.run() writes.
+
+Usage:
+    python benchmarks/bench_pipeline.py                      # 1k, 10k and 100k rows, xlsx
+    python benchmarks/bench_pipeline.py --rows 1000 1000000 --format csv --stream
+    python benchmarks/bench_pipeline.py --save-baseline      # store results as the new baseline
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+DEFAULT_DATA_DIR = os.path.join(BENCH_DIR, '.data')
+
+
+def prepare_sheet(rows: int, file_format: str, data_dir: str, seed: int) -> str:
+    """Return the path of a synthetic sheet, generating it on first use"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"customers_{rows}_{seed}.{file_format}")
+    if not os.path.exists(path):
+        from synthetic import generate_customer_sheet, write_customer_sheet
+        start = time.perf_counter()
+        write_customer_sheet(generate_customer_sheet(rows, seed), path)
+        print(f"Generated {path} in {time.perf_counter() - start:.1f}s")
+    return path
+
+
+def run_child(sheet: str, workdir: str, streaming: bool) -> None:
+    """Run one pipeline in this process and print its result as JSON"""
+    from synthetic import PAYMENT_DETAILS
+    with open(os.path.join(workdir, 'config.json'), 'w') as f:
+        json.dump({
+            'excel_path': sheet,
+            'sheet_name': 'CustomerData',
+            'admin_phones': ['+910000000000'],
+            'message_templates': {'payment_details': PAYMENT_DETAILS},
+            'use_cache': False,
+            'delivery': {'backend': 'fake', 'concurrency': 64}
+        }, f)
+    os.chdir(workdir)
+    # Imported after chdir so the log file lands in the scratch directory
+    from PaymentReminder import PaymentReminder
+
+    start = time.perf_counter()
+    reminder = PaymentReminder()
+    reminder.run(streaming=streaming)
+    wall = time.perf_counter() - start
+    profile = reminder.metrics.profile()
+    rows = profile['counters'].get('rows', 0)
+    print(json.dumps({
+        'rows': rows,
+        'wall_seconds': round(wall, 3),
+        'rows_per_second': round(rows / wall, 1),
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                             / (1 << 20 if sys.platform == 'darwin' else 1 << 10), 1),
+        'messages_sent': profile['counters'].get('messages_sent', 0),
+        'stages': {stage: stats['total_seconds'] for stage, stats in profile['stages'].items()},
+    }))
+
+
+def run_size(sheet: str, streaming: bool) -> dict:
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    command = [sys.executable, os.path.abspath(__file__), '--child', sheet, workdir]
+    if streaming:
+        command.append('--stream')
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def compare(result: dict, baseline: dict) -> str:
+    """Describe the change in throughput against the baseline entry"""
+    if not baseline:
+        return 'no baseline'
+    change = (result['rows_per_second'] / baseline['rows_per_second'] - 1) * 100
+    rss_change = result['peak_rss_mb'] - baseline['peak_rss_mb']
+    return f"{change:+.1f}% rows/s, {rss_change:+.1f} MB RSS vs baseline"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the reminder pipeline on synthetic sheets")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--format', choices=['xlsx', 'csv'], default='xlsx')
+    parser.add_argument('--stream', action='store_true', help="run with streaming=True")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="where generated sheets are kept for reuse")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the baseline")
+    parser.add_argument('--child', nargs=2, metavar=('SHEET', 'WORKDIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.stream)
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    mode = f"{args.format}{'-stream' if args.stream else ''}"
+    results = {}
+    for rows in args.rows:
+        sheet = prepare_sheet(rows, args.format, args.data_dir, args.seed)
+        result = run_size(sheet, args.stream)
+        key = f"{mode}:{rows}"
+        results[key] = result
+        print(f"\n{key}: {result['wall_seconds']:.2f}s, {result['rows_per_second']:,.0f} rows/s, "
+              f"peak RSS {result['peak_rss_mb']:.0f} MB, {result['messages_sent']} messages "
+              f"({compare(result, baseline.get(key))})")
+        for stage, seconds in sorted(result['stages'].items(), key=lambda item: -item[1]):
+            print(f"  {stage:<26}{seconds:9.3f}s")
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Measure how long cli.py commands take to start and which heavy modules they import
+
+Each command runs in a fresh interpreter in a scratch directory whose history
+holds --history-size entries, so the numbers include the whole process start.
+Light commands (help, check-config, history) must not import pandas, openpyxl
+or pywhatkit; the run exits with status 1 if one does or if it is slower
+than --max-ms.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 20 --max-ms 150
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+CLI = os.path.join(ROOT, 'cli.py')
+HEAVY_MODULES = ['pandas', 'numpy', 'openpyxl', 'pywhatkit']
+# (name, cli.py arguments, expected to stay light)
+COMMANDS = [
+    ('help', ['--help'], True),
+    ('check-config', ['check-config'], True),
+    ('history', ['history', '9000000007'], True),
+    ('validate-sheet', ['validate-sheet'], False),
+]
+
+
+def prepare_workdir(history_size: int) -> str:
+    """Create a scratch directory with a config, a small sheet and a filled history"""
+    from history_store import SqliteHistoryStore
+    from synthetic import PAYMENT_DETAILS
+
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    with open(os.path.join(workdir, 'CustomerData.csv'), 'w') as f:
+        f.write("Number,Name,Amount,Cycle,Mode,Status\n")
+        for i in range(100):
+            f.write(f"{9000000000 + i},Customer {i},300,January,gpay,unpaid\n")
+    with open(os.path.join(workdir, 'config.json'), 'w') as f:
+        json.dump({
+            'excel_path': 'CustomerData.csv',
+            'sheet_name': 'CustomerData',
+            'admin_phones': ['+910000000000'],
+            'message_templates': {'payment_details': PAYMENT_DETAILS},
+            'use_cache': False,
+            'analytics': {'enabled': False},
+            'delivery': {'backend': 'fake'}
+        }, f)
+    store = SqliteHistoryStore(os.path.join(workdir, 'reminder_history.db'))
+    store.put_entries({
+        f"{9000000000 + i}:Customer {i}": {'timestamp': '2024-01-01T10:00:00', 'data': {'Name': f"Customer {i}", 'Amount': '300.0'}}
+        for i in range(history_size)
+    })
+    store.close()
+    return workdir
+
+
+def time_command(command, workdir: str, repeat: int) -> float:
+    """Return the median wall time of the command in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=workdir, check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def heavy_imports(arguments, workdir: str) -> list:
+    """Return the heavy top-level modules the command imports, from python -X importtime"""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', CLI] + arguments, cwd=workdir,
+                            check=False, capture_output=True, text=True).stderr
+    imported = set()
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            imported.add(line.rsplit('|', 1)[1].strip().split('.')[0])
+    return [module for module in HEAVY_MODULES if module in imported]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the start-up time of cli.py commands")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--history-size', type=int, default=100_000)
+    parser.add_argument('--max-ms', type=float, default=250,
+                        help="fail if a light command takes longer than this")
+    args = parser.parse_args()
+
+    workdir = prepare_workdir(args.history_size)
+    # A bare interpreter start, for reference
+    print(f"{'python -c pass':<16}{time_command([sys.executable, '-c', 'pass'], workdir, args.repeat):7.1f} ms")
+    failures = []
+    for name, arguments, light in COMMANDS:
+        median = time_command([sys.executable, CLI] + arguments, workdir, args.repeat)
+        heavy = heavy_imports(arguments, workdir)
+        print(f"{name:<16}{median:7.1f} ms  {'imports ' + ', '.join(heavy) if heavy else 'no heavy imports'}")
+        if light and heavy:
+            failures.append(f"{name} imports {', '.join(heavy)}")
+        if light and median > args.max_ms:
+            failures.append(f"{name} took {median:.0f} ms (limit {args.max_ms:.0f} ms)")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
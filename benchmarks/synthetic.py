@@ -0,0 +1,63 @@
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+import pandas as pd
+
+MODES = ['gpay', 'GPay', ' g-pay', 'phonepe', 'Phone Pe', 'upi', 'bank transfer', 'NEFT', 'offline', 'Offline', 'cash']
+CYCLES = ['December', 'December and January', 'April may', 'march and april', 'jan feb mar apr']
+INACTIVE_STATUSES = ['inactive', 'deactivate', 'cancelled', 'closed']
+# Placeholder payment details for benchmark configs
+PAYMENT_DETAILS = {
+    'upi_number': '9000000000',
+    'upi_name': 'Benchmark',
+    'account_holder': 'BENCHMARK',
+    'account_number': '000000000000',
+    'bank_name': 'TEST BANK',
+    'branch': 'TEST',
+    'ifsc': 'TEST0000000',
+    'business_name': 'Benchmark Cable Vision',
+}
+
+
+def generate_customer_sheet(rows: int, seed: Optional[int] = 42) -> pd.DataFrame:
+    """Generate a customer sheet with the CustomerData.xlsx column layout"""
+    rng = random.Random(seed)
+    today = datetime.now()
+    records = []
+    for i in range(rows):
+        number = str(rng.randint(6000000000, 9999999999))
+        if rng.random() < 0.05:
+            number += f";{rng.randint(6000000000, 9999999999)}"
+        skip_until = None
+        if rng.random() < 0.05:
+            skip_until = (today + timedelta(days=rng.randint(-30, 30))).strftime('%d/%m/%Y')
+        records.append({
+            'S.No': i + 1,
+            'Name': f"{rng.randint(1, 40)} T{rng.randint(1, 5)} Customer {i}",
+            'Number': number if rng.random() > 0.002 else None,
+            'Amount': rng.choice([280, 560, 580, 650, 860, 1040, 3000]),
+            'Cycle': rng.choice(CYCLES),
+            'Status': 'paid' if rng.random() < 0.4 else ('inactive' if rng.random() < 0.02 else None),
+            'Mode': rng.choice(MODES),
+            'Smartcard Number': f"8306{rng.randint(0, 16 ** 8 - 1):08X}",
+            'Secondry Smartcard Number': f"8331{rng.randint(0, 16 ** 8 - 1):08X}" if rng.random() < 0.1 else None,
+            'Customer Status': rng.choice(INACTIVE_STATUSES) if rng.random() < 0.01 else 'active',
+            'SkipUntil': skip_until,
+        })
+    return pd.DataFrame(records)
+
+
+def write_customer_sheet(df: pd.DataFrame, path: str, sheet_name: str = 'CustomerData') -> None:
+    """Write a generated sheet as .csv or as an .xlsx workbook with a single sheet"""
+    if path.lower().endswith('.csv'):
+        df.to_csv(path, index=False)
+        return
+    # openpyxl's write-only mode keeps million-row workbooks out of memory
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    sheet.append(list(df.columns))
+    for values in df.itertuples(index=False):
+        sheet.append([None if pd.isna(value) else value for value in values])
+    workbook.save(path)
@@ -0,0 +1,200 @@
+"""Command line for the payment reminder: python cli.py <command> [options]
+
+Commands that read the sheet or send messages (run, report, plan,
+validate-sheet) import PaymentReminder, and with it pandas, when they start.
+check-config and history only load the config and the SQLite history, so
+they answer in a few tens of milliseconds; benchmarks/bench_startup.py keeps
+track of that.
+"""
+import argparse
+import json
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app_config import load_config
+
+
+def _open_reminder(config: Dict):
+    # pandas, openpyxl and the delivery engine load here, only for the commands that need them
+    from PaymentReminder import PaymentReminder
+    return PaymentReminder(config)
+
+
+def print_plan(plan: Dict, plan_file: Optional[str] = None) -> None:
+    """Print the summary of a PaymentReminder.plan() result, writing the full plan to plan_file if given"""
+    customers = sum(len(recipient['customers']) for recipient in plan['reminders'])
+    minutes, seconds = divmod(int(plan['estimated_seconds']['total']), 60)
+    print(f"Plan for {plan['sheet']} on {plan['date']} (nothing was sent or recorded)")
+    print(f"Reminders: {len(plan['reminders'])} messages for {customers} customers, "
+          f"{plan['reminders_skipped']} skipped as recently reminded, "
+          f"{plan['already_sent_today']} already sent today, {len(plan['invalid_numbers'])} invalid numbers")
+    print(f"Report: {len(plan['report']['messages'])} messages to each of {len(plan['report']['admins'])} admins")
+    print(f"Estimated delivery time: {minutes}m {seconds}s")
+    if plan_file:
+        with open(plan_file, 'w') as f:
+            json.dump(plan, f, indent=2, default=str)
+        print(f"Full plan written to {plan_file}")
+
+
+def command_run(config: Dict, args: argparse.Namespace) -> int:
+    reminder = _open_reminder(config)
+    try:
+        reminder.run(incremental=args.incremental, resume=args.resume, streaming=args.stream)
+    finally:
+        reminder.close()
+    return 0
+
+
+def command_report(config: Dict, args: argparse.Namespace) -> int:
+    reminder = _open_reminder(config)
+    try:
+        reminder.run(streaming=args.stream, send_reminders=False)
+    finally:
+        reminder.close()
+    return 0
+
+
+def command_plan(config: Dict, args: argparse.Namespace) -> int:
+    reminder = _open_reminder(config)
+    try:
+        print_plan(reminder.plan(incremental=args.incremental), args.output)
+    finally:
+        reminder.close()
+    return 0
+
+
+def command_validate_sheet(config: Dict, args: argparse.Namespace) -> int:
+    """Print the problems found in the sheet; exits with 1 if there are any"""
+    reminder = _open_reminder(config)
+    try:
+        result = reminder.validate_sheet()
+    except ValueError as e:
+        print(f"{config['excel_path']}: {e}")
+        return 1
+    finally:
+        reminder.close()
+    print(f"{result['sheet']}: {result['rows']} rows")
+    if result['missing_optional_columns']:
+        print(f"Optional columns not found: {', '.join(result['missing_optional_columns'])}")
+    sections = [
+        ('Rows without a number', result['missing_numbers']),
+        ('Entries that are not phone numbers', result['invalid_numbers']),
+        ('Missing or invalid amounts (counted as 0)', result['invalid_amounts']),
+        ('Unknown payment modes (treated as offline)',
+         [f"{mode}: {count} customers" for mode, count in result['unknown_modes'].items()]),
+        ('Smartcard issues', result['smartcard_issues']),
+    ]
+    problems = 0
+    for title, lines in sections:
+        if lines:
+            problems += len(lines)
+            print(f"\n{title} ({len(lines)}):")
+            for line in lines:
+                print(f"  {line}")
+    print(f"\n{problems} problems found" if problems else "No problems found")
+    return 1 if problems else 0
+
+
+def command_history(config: Dict, args: argparse.Namespace) -> int:
+    """Show when the customers on each given number were last reminded, and with what details"""
+    from history_store import open_history_store
+    from phone_numbers import customer_number_key, parse_phone_cell
+    phone_config = config['phone_numbers']
+    store = open_history_store(config)
+    try:
+        for number in args.numbers:
+            phones, invalid = parse_phone_cell(number, phone_config['country_code'], phone_config['national_digits'])
+            # History keys are "<customer number>:<name>", one per customer on the number
+            entries = store.find_entries(customer_number_key(phones, invalid, number, phone_config['country_code']) + ':')
+            if not entries:
+                print(f"{number}: no reminder on record")
+                continue
+            for customer_key, entry in entries:
+                name = customer_key.split(':', 1)[1]
+                sent = datetime.fromisoformat(entry['timestamp'])
+                days = (datetime.now().date() - sent.date()).days
+                print(f"{number} ({name}): last reminded {sent:%Y-%m-%d %H:%M} ({days} days ago)")
+                for field, value in entry['data'].items():
+                    print(f"  {field}: {value}")
+    finally:
+        store.close()
+    return 0
+
+
+def command_check_config(config: Dict, args: argparse.Namespace) -> int:
+    """Check the parts of the config that load_config cannot, without reading the sheet"""
+    import os
+    from message_templates import MessageTemplates
+    from transport import create_transport
+    errors = []
+    if not os.path.exists(config['excel_path']):
+        errors.append(f"Sheet not found: {config['excel_path']}")
+    try:
+        create_transport(config['delivery'])
+    except (ValueError, TypeError) as e:
+        errors.append(f"Delivery backend: {e}")
+    try:
+        MessageTemplates(config['message_templates']).render_reminder([
+            {'name': 'Test', 'amount': 100.0, 'cycle': 'January', 'mode': 'gpay', 'language': None}
+        ])
+    except Exception as e:
+        errors.append(f"Message templates: {e}")
+    print(f"Sheet: {config['excel_path']} ({config['sheet_name']})")
+    print(f"Admins: {', '.join(config['admin_phones'])}")
+    print(f"Delivery: {config['delivery']['backend']}, concurrency {config['delivery']['concurrency']}")
+    print(f"History: {config['history_backend']} at "
+          f"{config['history_path'] if config['history_backend'] == 'sqlite' else config['history_json_path']}")
+    for error in errors:
+        print(f"ERROR {error}")
+    print("Config OK" if not errors else f"{len(errors)} errors")
+    return 1 if errors else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Send WhatsApp payment reminders and the daily report")
+    parser.add_argument('--config', default='config.json')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="send today's reminders and the admin report")
+    run.add_argument('--incremental', action='store_true',
+                     help="only process rows that changed since the last run today")
+    run.add_argument('--resume', action='store_true',
+                     help="continue a run that was killed, delivering its unsent messages")
+    run.add_argument('--stream', action='store_true',
+                     help="read and process the sheet in chunks to keep memory flat on very large sheets")
+    run.set_defaults(handler=command_run)
+
+    report = commands.add_parser('report', help="send only the admin report, without reminders")
+    report.add_argument('--stream', action='store_true', help="read the sheet in chunks")
+    report.set_defaults(handler=command_report)
+
+    plan = commands.add_parser('plan', help="show what run would send, without sending or recording anything")
+    plan.add_argument('--incremental', action='store_true', help="plan an incremental run")
+    plan.add_argument('--output', help="also write the full plan with every message to this JSON file")
+    plan.set_defaults(handler=command_plan)
+
+    history = commands.add_parser('history', help="show when numbers were last reminded")
+    history.add_argument('numbers', nargs='+', help="phone numbers, in any format the sheet accepts")
+    history.set_defaults(handler=command_history)
+
+    validate = commands.add_parser('validate-sheet', help="check the sheet for missing or unreadable cells")
+    validate.set_defaults(handler=command_validate_sheet)
+
+    check = commands.add_parser('check-config', help="check config.json without reading the sheet")
+    check.set_defaults(handler=command_check_config)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError) as e:
+        print(f"Cannot load {args.config}: {e}")
+        return 1
+    return args.handler(config, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import argparse
+import copy
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from PaymentReminder import PaymentReminder
+from log_setup import stop_logging
+
+
+def load_config(path: str = 'config.json') -> Dict:
+    """Load the coordinator config and fill in the sharding defaults"""
+    with open(path, 'r') as f:
+        config = json.load(f)
+    sharding = config.setdefault('sharding', {})
+    # Sheets to process, each {'name', 'excel_path', 'sheet_name'}; defaults to the main sheet
+    sharding.setdefault('sheets', [])
+    # Each sheet is split into this many shards by customer
+    sharding.setdefault('row_shards', 1)
+    sharding.setdefault('processes', None)
+    sharding.setdefault('partition_dir', 'partitions')
+    return config
+
+
+def plan_shards(config: Dict) -> List[Tuple[str, Dict, Optional[Tuple[int, int]]]]:
+    """Return (name, worker config, shard) for every sheet and row shard
+
+    All shards share the SQLite reminder history, so a customer reminded by an
+    earlier run is not reminded again whatever the shard layout. Every shard
+    gets its own row fingerprints, send queue, cache and profile directory
+    under the partition directory.
+    """
+    if config.get('history_backend', 'sqlite') != 'sqlite':
+        raise ValueError("Sharded runs need history_backend 'sqlite', which several processes can share")
+    sharding = config['sharding']
+    sheets = sharding['sheets'] or [{
+        'name': os.path.splitext(os.path.basename(config['excel_path']))[0],
+        'excel_path': config['excel_path'],
+        'sheet_name': config['sheet_name']
+    }]
+    row_shards = max(1, int(sharding['row_shards']))
+    base = {key: value for key, value in config.items() if key != 'sharding'}
+    shards = []
+    for sheet in sheets:
+        for index in range(row_shards):
+            name = sheet['name'] if row_shards == 1 else f"{sheet['name']}-{index + 1}of{row_shards}"
+            partition = os.path.join(sharding['partition_dir'], name)
+            worker_config = copy.deepcopy(base)
+            worker_config['excel_path'] = sheet['excel_path']
+            worker_config['sheet_name'] = sheet.get('sheet_name', config['sheet_name'])
+            # Committing fingerprints drops the rows a run did not see, so shards cannot share them
+            worker_config['fingerprint_path'] = os.path.join(partition, 'row_fingerprints.db')
+            worker_config.setdefault('send_queue', {})['path'] = os.path.join(partition, 'send_queue.db')
+            worker_config['cache_dir'] = os.path.join(partition, 'cache')
+            # Rotating one log file from several processes would race, so each shard logs on its own
+            worker_config['logging'] = dict(worker_config.get('logging', {}),
+                                            path=os.path.join(partition, 'payment_reminder.log'))
+            # The coordinator writes the exporter file for the whole run
+            worker_config['metrics'] = dict(worker_config.get('metrics', {}),
+                                            profile_dir=os.path.join(partition, 'profiles'),
+                                            exporter_path=None)
+            shards.append((name, worker_config, (index, row_shards) if row_shards > 1 else None))
+    return shards
+
+
+def run_shard(name: str, config: Dict, shard: Optional[Tuple[int, int]], incremental: bool,
+              resume: bool, streaming: bool) -> Dict:
+    """Process one shard without sending a report and return what the report needs"""
+    os.makedirs(os.path.dirname(config['fingerprint_path']), exist_ok=True)
+    reminder = PaymentReminder(config, shard)
+    logging.info(f"Shard {name}: starting (pid {os.getpid()})")
+    try:
+        reminder.run(incremental=incremental, resume=resume, streaming=streaming, send_report=False)
+    finally:
+        # Pool workers exit without running atexit hooks, so write out the queued log records now
+        stop_logging()
+    result = {
+        'name': name,
+        'stats': reminder.stats,
+        'paid_smartcards': list(reminder.paid_smartcards),
+        'inactive_customers': list(reminder.inactive_customers),
+        'failed_messages': reminder.failed_messages,
+        'customer_index': reminder.customer_index,
+        'counters': reminder.metrics.counters,
+        'duration_seconds': reminder.metrics.profile()['duration_seconds'],
+    }
+    reminder.close()
+    return result
+
+
+def merge_results(reminder: PaymentReminder, results: List[Dict], errors: Dict[str, str]) -> None:
+    """Fold per-shard results into reminder, in shard order, for one consolidated report"""
+    breakdown = ["SHARDS:", "----------------------------------------"]
+    for result in results:
+        for mode, mode_stats in result['stats'].items():
+            for key, value in mode_stats.items():
+                reminder.stats[mode][key] += value
+        reminder.paid_smartcards.extend(result['paid_smartcards'])
+        reminder.inactive_customers.extend(result['inactive_customers'])
+        reminder.failed_messages.extend(dict(msg, shard=result['name']) for msg in result['failed_messages'])
+        if result['customer_index'] is None:
+            # Streaming shards do not index smartcards, so the report cannot list their issues
+            reminder.customer_index = None
+        elif reminder.customer_index is not None:
+            reminder.customer_index.merge(result['customer_index'])
+        for counter, value in result['counters'].items():
+            reminder.metrics.increment(counter, value)
+        reminder.metrics.observe('shard', result['duration_seconds'])
+
+        online, offline = result['stats']['online'], result['stats']['offline']
+        breakdown.append(
+            f"{result['name']}: {online['total'] + offline['total']} customers, "
+            f"pending ₹{online['unpaid_amount'] + offline['unpaid_amount']}, "
+            f"{len(result['failed_messages'])} failed"
+        )
+    for name, error in errors.items():
+        breakdown.append(f"{name}: FAILED - {error}")
+    breakdown.append("----------------------------------------")
+    reminder.report_sections.append('\n'.join(breakdown))
+
+
+def run_sharded(config: Dict, incremental: bool = False, resume: bool = False,
+                streaming: bool = False) -> None:
+    """Run every shard in a process pool and send one report for all of them"""
+    shards = plan_shards(config)
+    processes = config['sharding']['processes'] or min(len(shards), os.cpu_count() or 1)
+    backend = config.get('delivery', {}).get('backend', 'pywhatkit')
+    if backend == 'pywhatkit' and processes > 1:
+        # pywhatkit drives a single browser window, which processes cannot share
+        logging.warning("The pywhatkit backend cannot send from several processes; running shards one at a time")
+        processes = 1
+    if processes > 1:
+        # Rates in the config are for the whole run, so each process gets its share
+        for _, worker_config, _ in shards:
+            limits = worker_config.get('delivery', {}).get('rate_limit', {})
+            for key in ('rate', 'min_rate', 'max_rate'):
+                if limits.get(key):
+                    limits[key] /= processes
+    logging.info(f"Running {len(shards)} shards in {processes} processes")
+
+    results: Dict[str, Dict] = {}
+    errors: Dict[str, str] = {}
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {
+            pool.submit(run_shard, name, worker_config, shard, incremental, resume, streaming): name
+            for name, worker_config, shard in shards
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+                logging.info(f"Shard {name} finished")
+            except Exception as e:
+                logging.error(f"Shard {name} failed: {str(e)}")
+                errors[name] = str(e)
+
+    # The report instance only sends the report; its stores live in their own partition
+    report_config = copy.deepcopy({key: value for key, value in config.items() if key != 'sharding'})
+    partition = os.path.join(config['sharding']['partition_dir'], '_coordinator')
+    os.makedirs(partition, exist_ok=True)
+    report_config['history_path'] = os.path.join(partition, 'reminder_history.db')
+    report_config['history_json_path'] = os.path.join(partition, 'reminder_history.json')
+    report_config.setdefault('send_queue', {})['path'] = os.path.join(partition, 'send_queue.db')
+    reminder = PaymentReminder(report_config)
+    merge_results(reminder, [results[name] for name, _, _ in shards if name in results], errors)
+    try:
+        reminder.generate_report()
+    finally:
+        reminder.write_run_profile()
+    if errors:
+        raise RuntimeError(f"{len(errors)} of {len(shards)} shards failed: {', '.join(errors)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process several sheets, or shards of one sheet, in parallel")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--incremental', action='store_true',
+                        help="only process rows that changed since the last run today")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue a run that was killed, delivering its unsent messages")
+    parser.add_argument('--stream', action='store_true',
+                        help="read and process each sheet in chunks")
+    args = parser.parse_args()
+
+    run_sharded(load_config(args.config), incremental=args.incremental, resume=args.resume, streaming=args.stream)
@@ -0,0 +1,58 @@
+from typing import Dict, Iterable, List, Tuple
+
+
+class CustomerIndex:
+    """Smartcard lookups over the customers of one run
+
+    Built once per run from the classified sheet. owner_by_smartcard maps each
+    smartcard to the first (customer number, name) listing it. A smartcard
+    listed again by the same customer is counted as a duplicate, and one
+    listed by another customer as a conflict.
+    """
+
+    def __init__(self):
+        self.owner_by_smartcard: Dict[str, Tuple[str, str]] = {}
+        self.duplicate_smartcards: Dict[str, int] = {}
+        self.conflicting_smartcards: Dict[str, List[Tuple[str, str]]] = {}
+
+    def add_smartcards(self, cards: Iterable[str], customer_keys: Iterable[str], names: Iterable[str]) -> None:
+        """Add many (smartcard, customer number, name) listings at once"""
+        owner_by_smartcard = self.owner_by_smartcard
+        for card, customer_key, name in zip(cards, customer_keys, names):
+            if card not in owner_by_smartcard:
+                owner_by_smartcard[card] = (customer_key, name)
+            else:
+                self.add_smartcard(card, customer_key, name)
+
+    def add_smartcard(self, card: str, customer_key: str, name: str) -> None:
+        owner = self.owner_by_smartcard.get(card)
+        if owner is None:
+            self.owner_by_smartcard[card] = (customer_key, name)
+        elif owner == (customer_key, name):
+            self.duplicate_smartcards[card] = self.duplicate_smartcards.get(card, 0) + 1
+        else:
+            others = self.conflicting_smartcards.setdefault(card, [])
+            if (customer_key, name) not in others:
+                others.append((customer_key, name))
+
+    def merge(self, other: 'CustomerIndex') -> None:
+        """Fold in the index of another shard"""
+        for card, (customer_key, name) in other.owner_by_smartcard.items():
+            self.add_smartcard(card, customer_key, name)
+        for card, count in other.duplicate_smartcards.items():
+            self.duplicate_smartcards[card] = self.duplicate_smartcards.get(card, 0) + count
+        for card, owners in other.conflicting_smartcards.items():
+            for customer_key, name in owners:
+                self.add_smartcard(card, customer_key, name)
+
+    def smartcard_issues(self) -> List[str]:
+        """Describe every duplicate and conflicting smartcard, one line each"""
+        issues = []
+        for card, others in self.conflicting_smartcards.items():
+            owners = [self.owner_by_smartcard[card]] + others
+            issues.append(f"{card}: listed for {len(owners)} customers - "
+                          + ', '.join(f"{name} ({customer_key})" for customer_key, name in owners))
+        for card, extra in self.duplicate_smartcards.items():
+            customer_key, name = self.owner_by_smartcard[card]
+            issues.append(f"{card}: listed {extra + 1} times for {name} ({customer_key})")
+        return issues
@@ -0,0 +1,179 @@
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import date, datetime
+from datetime import time as clock_time
+from typing import Dict, List, Optional, Set, Tuple
+
+from PaymentReminder import PaymentReminder
+
+REMINDERS = 'reminders'
+REPORT = 'report'
+
+
+def apply_daemon_defaults(config: Dict) -> Dict:
+    """Fill in the daemon section of the config"""
+    daemon = config.setdefault('daemon', {})
+    # Times of day (HH:MM) at which a reminder pass runs
+    daemon.setdefault('reminder_times', ['10:00'])
+    # Time of day the admin report is sent; that pass also sends reminders if allowed
+    daemon.setdefault('report_time', '20:00')
+    # Customers are only messaged inside these [start, end] windows...
+    daemon.setdefault('send_windows', [['09:00', '21:00']])
+    # ...and never during quiet hours, given as [start, end]; may wrap midnight
+    daemon.setdefault('quiet_hours', None)
+    daemon.setdefault('poll_seconds', 30)
+    return config
+
+
+def parse_clock(value: str) -> clock_time:
+    return datetime.strptime(value, '%H:%M').time()
+
+
+def in_period(now: clock_time, start: str, end: str) -> bool:
+    """Return True if now lies in [start, end), where end before start wraps past midnight"""
+    start_time, end_time = parse_clock(start), parse_clock(end)
+    if start_time <= end_time:
+        return start_time <= now < end_time
+    return now >= start_time or now < end_time
+
+
+class ReminderDaemon:
+    """Run reminder passes and the daily report on a schedule from one long-lived process
+
+    The PaymentReminder instance, with its open history store and skip index,
+    compiled templates and parsed sheet, is kept between passes. It is rebuilt
+    only when the config file changes; the sheet is re-read when its file
+    changes.
+    """
+
+    def __init__(self, config_path: str = 'config.json', incremental: bool = False,
+                 streaming: bool = False, run_now: bool = False):
+        self.config_path = config_path
+        self.incremental = incremental
+        self.streaming = streaming
+        self.reminder: Optional[PaymentReminder] = None
+        self.config_mtime: Optional[int] = None
+        self.completed: Set[Tuple[date, str, str]] = set()
+        self.load()
+        # Events scheduled before startup are not caught up on; run_now does one pass straight away
+        self.skip_past_events(datetime.now())
+        self.deferred: Set[Tuple[date, str, str]] = set()
+        self.run_now = run_now
+
+    def load(self) -> None:
+        """(Re)build the PaymentReminder from the config file
+
+        The new instance is built before the running one is closed, so a config
+        that fails to load leaves the daemon on the previous one.
+        """
+        config_mtime = os.stat(self.config_path).st_mtime_ns
+        with open(self.config_path, 'r') as f:
+            config = apply_daemon_defaults(json.load(f))
+        reminder = PaymentReminder(config)
+        reminder.delivery_allowed = lambda: self.sending_allowed(datetime.now())
+        if self.reminder is not None:
+            self.reminder.close()
+        self.reminder = reminder
+        self.settings = config['daemon']
+        self.config_mtime = config_mtime
+        logging.info(f"Daemon loaded {self.config_path}: reminders at {', '.join(self.settings['reminder_times'])}, "
+                     f"report at {self.settings['report_time']}")
+
+    def skip_past_events(self, now: datetime, known: Set[Tuple[str, str]] = frozenset()) -> None:
+        """Mark today's events up to now as done, except those in known (already scheduled before a reload)"""
+        self.completed.update(
+            (now.date(), kind, at) for kind, at in self.schedule()
+            if parse_clock(at) <= now.time() and (kind, at) not in known
+        )
+
+    def reload_if_changed(self, now: datetime) -> None:
+        try:
+            changed = os.stat(self.config_path).st_mtime_ns != self.config_mtime
+        except FileNotFoundError:
+            return
+        if changed:
+            logging.info(f"{self.config_path} changed, reloading")
+            known = set(self.schedule())
+            try:
+                self.load()
+                # Times added by the edit are not caught up on, like events before startup
+                self.skip_past_events(now, known)
+            except Exception as e:
+                # Keep running on the previous config until the file is fixed
+                logging.error(f"Could not reload config, keeping the previous one: {str(e)}")
+                self.config_mtime = os.stat(self.config_path).st_mtime_ns
+
+    def schedule(self) -> List[Tuple[str, str]]:
+        """Return the (kind, HH:MM) events of a day"""
+        events = [(REMINDERS, at) for at in self.settings['reminder_times']]
+        if self.settings['report_time']:
+            events.append((REPORT, self.settings['report_time']))
+        return events
+
+    def sending_allowed(self, now: datetime) -> bool:
+        """Return True if customers may be messaged at now"""
+        current = now.time()
+        quiet_hours = self.settings['quiet_hours']
+        if quiet_hours and in_period(current, *quiet_hours):
+            return False
+        windows = self.settings['send_windows']
+        return not windows or any(in_period(current, start, end) for start, end in windows)
+
+    def tick(self, now: Optional[datetime] = None) -> None:
+        """Run every event that is due at now and has not run yet today"""
+        now = now or datetime.now()
+        self.reload_if_changed(now)
+        allowed = self.sending_allowed(now)
+        if self.run_now and allowed:
+            self.run_pass(send_report=False, send_reminders=True)
+            self.run_now = False
+        due = [(kind, at) for kind, at in self.schedule()
+               if parse_clock(at) <= now.time() and (now.date(), kind, at) not in self.completed]
+        for kind, at in due:
+            event = (now.date(), kind, at)
+            if kind == REMINDERS and not allowed:
+                # Wait for the send window to open; the event is dropped if it does not open today
+                if event not in self.deferred:
+                    logging.info(f"Reminder pass scheduled at {at} deferred until sending is allowed")
+                    self.deferred.add(event)
+                continue
+            self.run_pass(send_report=(kind == REPORT), send_reminders=allowed)
+            self.completed.add(event)
+
+    def run_pass(self, send_report: bool, send_reminders: bool) -> None:
+        self.reminder.reset_run_state()
+        try:
+            self.reminder.run(incremental=self.incremental, streaming=self.streaming,
+                              send_report=send_report, send_reminders=send_reminders)
+        except Exception as e:
+            # A failed pass is logged; the daemon carries on with the next event
+            logging.error(f"Daemon pass failed: {str(e)}")
+
+    def run_forever(self) -> None:
+        logging.info("Payment reminder daemon started")
+        try:
+            while True:
+                self.tick()
+                time.sleep(self.settings['poll_seconds'])
+        except KeyboardInterrupt:
+            logging.info("Payment reminder daemon stopped")
+        finally:
+            self.reminder.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send reminders and the daily report on a schedule")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--incremental', action='store_true',
+                        help="only process rows that changed since the last pass today")
+    parser.add_argument('--stream', action='store_true',
+                        help="read and process the sheet in chunks on every pass")
+    parser.add_argument('--run-now', action='store_true',
+                        help="run a reminder pass at startup instead of waiting for the next scheduled time")
+    args = parser.parse_args()
+
+    ReminderDaemon(args.config, incremental=args.incremental, streaming=args.stream,
+                   run_now=args.run_now).run_forever()
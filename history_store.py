@@ -0,0 +1,345 @@
+import json
+import logging
+import os
+import sqlite3
+from collections.abc import MutableMapping
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def upgrade_history_key(customer_key: str, entry: Dict) -> str:
+    """Return the "<number>:<name>" key of an entry stored under the customer number alone
+
+    Older versions keyed history by the number only; the entry's data holds
+    the name the reminder was sent for. Other keys are returned unchanged.
+    """
+    name = entry.get('data', {}).get('Name')
+    if ':' in customer_key or not name:
+        return customer_key
+    return f"{customer_key}:{' '.join(str(name).split())}"
+
+
+class HistoryStore(MutableMapping):
+    """Base class for reminder history backends
+
+    Entries are keyed by customer key and hold {'timestamp': ..., 'data': {...}},
+    the same shape as reminder_history.json, so a store can be used like a dict.
+    """
+
+    def get_entry(self, customer_key: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def put_entry(self, customer_key: str, entry: Dict) -> None:
+        raise NotImplementedError
+
+    def iter_entries(self) -> Iterator[Tuple[str, Dict]]:
+        """Yield (customer_key, entry) for every stored entry"""
+        for customer_key in list(self):
+            yield customer_key, self[customer_key]
+
+    def find_entries(self, key_prefix: str) -> List[Tuple[str, Dict]]:
+        """Return (customer_key, entry) for every key starting with key_prefix"""
+        return [(key, entry) for key, entry in self.iter_entries() if key.startswith(key_prefix)]
+
+    def flush(self) -> None:
+        """Make all updates durable"""
+
+    def close(self) -> None:
+        self.flush()
+
+    def __getitem__(self, customer_key: str) -> Dict:
+        entry = self.get_entry(customer_key)
+        if entry is None:
+            raise KeyError(customer_key)
+        return entry
+
+    def __setitem__(self, customer_key: str, entry: Dict) -> None:
+        self.put_entry(customer_key, entry)
+
+
+class JsonHistoryStore(HistoryStore):
+    """Keep history in memory and rewrite the whole JSON file on flush"""
+
+    def __init__(self, path: str = 'reminder_history.json'):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = {upgrade_history_key(key, entry): entry for key, entry in json.load(f).items()}
+            except Exception as e:
+                logging.error(f"Error loading reminder history: {str(e)}")
+
+    def get_entry(self, customer_key: str) -> Optional[Dict]:
+        return self.entries.get(customer_key)
+
+    def put_entry(self, customer_key: str, entry: Dict) -> None:
+        self.entries[customer_key] = entry
+
+    def __delitem__(self, customer_key: str) -> None:
+        del self.entries[customer_key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def flush(self) -> None:
+        with open(self.path, 'w') as f:
+            json.dump(self.entries, f, indent=2)
+
+
+class SqliteHistoryStore(HistoryStore):
+    """Keep history in SQLite, committing every update as it happens"""
+
+    def __init__(self, path: str = 'reminder_history.db'):
+        self.path = path
+        # isolation_level=None puts the connection in autocommit mode
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS reminder_history ('
+            'customer_key TEXT PRIMARY KEY, '
+            'timestamp TEXT NOT NULL, '
+            'data TEXT NOT NULL)'
+        )
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] < 1:
+            self._upgrade_keys()
+
+    def _upgrade_keys(self) -> None:
+        """Rewrite the number-only keys of older versions to "<number>:<name>", once per database"""
+        with self.connection:
+            # IMMEDIATE takes the write lock first, so processes opening the store together upgrade it once
+            self.connection.execute('BEGIN IMMEDIATE')
+            if self.connection.execute('PRAGMA user_version').fetchone()[0] >= 1:
+                return
+            upgraded = 0
+            for customer_key, timestamp, data in self.connection.execute(
+                "SELECT customer_key, timestamp, data FROM reminder_history WHERE customer_key NOT LIKE '%:%'"
+            ).fetchall():
+                new_key = upgrade_history_key(customer_key, {'data': json.loads(data)})
+                if new_key != customer_key:
+                    self.connection.execute(
+                        'INSERT OR IGNORE INTO reminder_history (customer_key, timestamp, data) VALUES (?, ?, ?)',
+                        (new_key, timestamp, data)
+                    )
+                    self.connection.execute('DELETE FROM reminder_history WHERE customer_key = ?', (customer_key,))
+                    upgraded += 1
+            self.connection.execute('PRAGMA user_version = 1')
+        if upgraded:
+            logging.info(f"Upgraded {upgraded} reminder history keys in {self.path} to <number>:<name>")
+
+    def get_entry(self, customer_key: str) -> Optional[Dict]:
+        row = self.connection.execute(
+            'SELECT timestamp, data FROM reminder_history WHERE customer_key = ?',
+            (customer_key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'timestamp': row[0], 'data': json.loads(row[1])}
+
+    def put_entry(self, customer_key: str, entry: Dict) -> None:
+        self.connection.execute(
+            'INSERT OR REPLACE INTO reminder_history (customer_key, timestamp, data) VALUES (?, ?, ?)',
+            (customer_key, entry['timestamp'], json.dumps(entry['data']))
+        )
+
+    def put_entries(self, entries: Dict[str, Dict]) -> None:
+        """Insert many entries in a single transaction"""
+        with self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO reminder_history (customer_key, timestamp, data) VALUES (?, ?, ?)',
+                ((key, entry['timestamp'], json.dumps(entry['data'])) for key, entry in entries.items())
+            )
+
+    def iter_entries(self) -> Iterator[Tuple[str, Dict]]:
+        for customer_key, timestamp, data in self.connection.execute(
+            'SELECT customer_key, timestamp, data FROM reminder_history'
+        ):
+            yield customer_key, {'timestamp': timestamp, 'data': json.loads(data)}
+
+    def find_entries(self, key_prefix: str) -> List[Tuple[str, Dict]]:
+        # Keys starting with the prefix sort between it and the prefix with its last character incremented
+        upper = key_prefix[:-1] + chr(ord(key_prefix[-1]) + 1)
+        return [(customer_key, {'timestamp': timestamp, 'data': json.loads(data)})
+                for customer_key, timestamp, data in self.connection.execute(
+                    'SELECT customer_key, timestamp, data FROM reminder_history '
+                    'WHERE customer_key >= ? AND customer_key < ? ORDER BY customer_key',
+                    (key_prefix, upper)
+                )]
+
+    def __contains__(self, customer_key) -> bool:
+        return self.connection.execute(
+            'SELECT 1 FROM reminder_history WHERE customer_key = ?', (customer_key,)
+        ).fetchone() is not None
+
+    def __delitem__(self, customer_key: str) -> None:
+        if customer_key not in self:
+            raise KeyError(customer_key)
+        self.connection.execute('DELETE FROM reminder_history WHERE customer_key = ?', (customer_key,))
+
+    def __iter__(self) -> Iterator[str]:
+        for (customer_key,) in self.connection.execute('SELECT customer_key FROM reminder_history').fetchall():
+            yield customer_key
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM reminder_history').fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class ReminderIndex:
+    """Compact in-memory view of the reminder history for skip decisions
+
+    Each customer key maps to one int packing the ordinal day of the last
+    reminder with a 64-bit digest of the data it was sent for, so a skip
+    check is an integer and a hash comparison instead of parsing a timestamp
+    and comparing dicts.
+    """
+
+    DIGEST_BITS = 64
+    DIGEST_MASK = (1 << DIGEST_BITS) - 1
+
+    def __init__(self, store: HistoryStore):
+        self.entries: Dict[str, int] = {}
+        for customer_key, entry in store.iter_entries():
+            # Timestamps are ISO format, so the first 10 characters are the date
+            day = date.fromisoformat(entry['timestamp'][:10]).toordinal()
+            self.entries[customer_key] = self._pack(day, self.digest(entry['data']))
+
+    @classmethod
+    def digest(cls, data: Dict) -> int:
+        """Return a digest that is equal for equal data dicts within this process"""
+        return hash(json.dumps(data, sort_keys=True)) & cls.DIGEST_MASK
+
+    def _pack(self, day: int, digest: int) -> int:
+        return (day << self.DIGEST_BITS) | digest
+
+    def lookup(self, customer_key: str) -> Optional[Tuple[int, int]]:
+        """Return (last reminded ordinal day, data digest) or None if never reminded"""
+        packed = self.entries.get(customer_key)
+        if packed is None:
+            return None
+        return packed >> self.DIGEST_BITS, packed & self.DIGEST_MASK
+
+    def record(self, customer_key: str, day: int, data: Dict) -> None:
+        self.entries[customer_key] = self._pack(day, self.digest(data))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def migrate_json_history(json_path: str, store: SqliteHistoryStore) -> int:
+    """Copy entries from a reminder_history.json file into an empty SQLite store
+
+    Returns the number of migrated entries. The JSON file is left in place.
+    """
+    if len(store) or not os.path.exists(json_path):
+        return 0
+    with open(json_path, 'r') as f:
+        entries = {upgrade_history_key(key, entry): entry for key, entry in json.load(f).items()}
+    store.put_entries(entries)
+    logging.info(f"Migrated {len(entries)} reminder history entries from {json_path} to {store.path}")
+    return len(entries)
+
+
+def open_history_store(config: Dict) -> HistoryStore:
+    """Open the history backend named in the config, migrating JSON history on first use"""
+    backend = config.get('history_backend', 'sqlite')
+    if backend == 'json':
+        return JsonHistoryStore(config.get('history_json_path', 'reminder_history.json'))
+    if backend == 'sqlite':
+        store = SqliteHistoryStore(config.get('history_path', 'reminder_history.db'))
+        migrate_json_history(config.get('history_json_path', 'reminder_history.json'), store)
+        return store
+    raise ValueError(f"Unknown history backend: {backend}")
+
+
+class RowFingerprintStore:
+    """Persist a fingerprint of every sheet row for incremental runs
+
+    Each row key maps to the hash of the row's reminder-relevant cells and the
+    ordinal day the row was last fully processed. During a run, rows are staged
+    in temporary tables and only committed once the run's deliveries are done,
+    so a crashed run never marks rows as processed.
+    """
+
+    def __init__(self, path: str = 'reminder_history.db'):
+        self.path = path
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS row_fingerprints ('
+            'row_key TEXT PRIMARY KEY, '
+            'fingerprint TEXT NOT NULL, '
+            'processed_on INTEGER NOT NULL)'
+        )
+        self.connection.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS staged_fingerprints ('
+            'row_key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, customer_number TEXT NOT NULL)'
+        )
+        self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS seen_row_keys (row_key TEXT PRIMARY KEY)')
+
+    def lookup(self, row_keys: List[str], batch_size: int = 500) -> Dict[str, Tuple[str, int]]:
+        """Return {row_key: (fingerprint, processed_on)} for the stored keys among row_keys"""
+        found = {}
+        for start in range(0, len(row_keys), batch_size):
+            batch = row_keys[start:start + batch_size]
+            placeholders = ','.join('?' * len(batch))
+            for row_key, fingerprint, processed_on in self.connection.execute(
+                f'SELECT row_key, fingerprint, processed_on FROM row_fingerprints WHERE row_key IN ({placeholders})',
+                batch
+            ):
+                found[row_key] = (fingerprint, processed_on)
+        return found
+
+    def stage(self, seen: Iterable[str], touched: Iterable[Tuple[str, str, str]]) -> None:
+        """Record the keys present in the sheet and the (row_key, fingerprint, customer_number) rows processed"""
+        with self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO seen_row_keys (row_key) VALUES (?)', ((row_key,) for row_key in seen)
+            )
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO staged_fingerprints (row_key, fingerprint, customer_number) VALUES (?, ?, ?)',
+                touched
+            )
+
+    def commit(self, processed_on: int, pending_customers: Iterable[str]) -> None:
+        """Store the staged rows as processed on processed_on and drop rows no longer in the sheet
+
+        Rows of pending_customers (e.g. whose delivery failed) are stored as not
+        processed, so the next incremental run picks them up again.
+        """
+        pending = list(pending_customers)
+        with self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.execute(
+                'INSERT OR REPLACE INTO row_fingerprints (row_key, fingerprint, processed_on) '
+                'SELECT row_key, fingerprint, ? FROM staged_fingerprints',
+                (processed_on,)
+            )
+            # Row keys are "<customer number>#<occurrence>", so '$' (the character after '#') bounds the range
+            self.connection.executemany(
+                'UPDATE row_fingerprints SET processed_on = 0 WHERE row_key >= ? AND row_key < ?',
+                ((f"{customer}#", f"{customer}$") for customer in pending)
+            )
+            self.connection.execute(
+                'DELETE FROM row_fingerprints WHERE row_key NOT IN (SELECT row_key FROM seen_row_keys)'
+            )
+            self.connection.execute('DELETE FROM staged_fingerprints')
+            self.connection.execute('DELETE FROM seen_row_keys')
+
+    def discard_staged(self) -> None:
+        """Forget the rows staged so far without recording them as processed"""
+        with self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.execute('DELETE FROM staged_fingerprints')
+            self.connection.execute('DELETE FROM seen_row_keys')
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,145 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# Most records written in one batch
+BATCH_SIZE = 1000
+
+_writer: Optional['LogWriter'] = None
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves formatting to the writer thread
+
+    The stock QueueHandler formats every record in the calling thread. Log
+    arguments here are plain strings and numbers, so the record can be queued
+    as-is and the %-formatting happens off the send loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'function': record.funcName,
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LogWriter:
+    """Background thread that writes queued records to a file handler in batches
+
+    Everything already queued is formatted and written with a single write,
+    rollover check and flush, so a burst of log lines costs one system call
+    instead of one per line.
+    """
+
+    _STOP = object()
+
+    def __init__(self, log_queue: queue.SimpleQueue, handler: logging.FileHandler):
+        self.queue = log_queue
+        self.handler = handler
+        self.thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch: List = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is self._STOP
+            records = [record for record in batch if record is not self._STOP]
+            if records:
+                self._write(records)
+            if stop:
+                return
+
+    def _write(self, records: List[logging.LogRecord]) -> None:
+        handler = self.handler
+        try:
+            text = ''.join(handler.format(record) + handler.terminator for record in records
+                           if record.levelno >= handler.level)
+            if isinstance(handler, logging.handlers.BaseRotatingHandler) and handler.shouldRollover(records[0]):
+                handler.doRollover()
+            if handler.stream is None:
+                handler.stream = handler._open()
+            handler.stream.write(text)
+            handler.stream.flush()
+        except Exception:
+            handler.handleError(records[0])
+
+    def stop(self) -> None:
+        self.queue.put(self._STOP)
+        self.thread.join()
+        self.handler.close()
+
+
+def _file_handler(config: Dict) -> logging.FileHandler:
+    rotation = config['rotation']
+    if rotation == 'size':
+        return logging.handlers.RotatingFileHandler(
+            config['path'], maxBytes=config['max_bytes'], backupCount=config['backup_count'], encoding='utf-8'
+        )
+    if rotation == 'time':
+        return logging.handlers.TimedRotatingFileHandler(
+            config['path'], when=config['when'], backupCount=config['backup_count'], encoding='utf-8'
+        )
+    if not rotation:
+        return logging.FileHandler(config['path'], encoding='utf-8')
+    raise ValueError(f"Unknown log rotation: {rotation}")
+
+
+def configure_logging(config: Dict) -> None:
+    """Send root logging through a background thread to a rotating file
+
+    Replaces any handlers already on the root logger, including an earlier
+    call's, so it is safe to call once per PaymentReminder instance.
+    """
+    global _writer
+    if config['format'] == 'json':
+        formatter: logging.Formatter = JsonFormatter()
+    elif config['format'] == 'text':
+        formatter = logging.Formatter(TEXT_FORMAT)
+    else:
+        raise ValueError(f"Unknown log format: {config['format']}")
+    handler = _file_handler(config)
+    handler.setFormatter(formatter)
+
+    stop_logging()
+    root = logging.getLogger()
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+        old_handler.close()
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(config['level'])
+    _writer = LogWriter(log_queue, handler)
+
+
+def stop_logging() -> None:
+    """Write out queued records and stop the background thread"""
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,174 @@
+import logging
+from string import Formatter
+from typing import Dict, List, Tuple
+
+# Fields filled in for each message, and the template parts that can use them;
+# every other template field is a payment detail from config.json
+MESSAGE_FIELDS = {'amount', 'cycle', 'name', 'total'}
+PART_FIELDS = {
+    'single_due': {'name', 'amount', 'cycle'},
+    'due_line': {'name', 'amount', 'cycle'},
+    'multi_due_total': {'total'},
+}
+
+# English reminder text. {amount}, {cycle}, {name} and {total} are filled per
+# message in the parts listed in PART_FIELDS; every other field comes from the
+# payment details at startup: upi_number, upi_name, account_holder,
+# account_number, bank_name, branch, ifsc and business_name.
+DEFAULT_TEMPLATES = {
+    'header': (
+        "*📺 CABLE TV PAYMENT REMINDER 📺*\n\n"
+        "Dear Customer,\n\n"
+    ),
+    'single_due': (
+        "We request you to kindly pay your Cable TV subscription.\n"
+        "💰 *Amount Due: ₹{amount}*\n"
+        "📅 *Period: {cycle}*\n\n"
+    ),
+    'multi_due_intro': "We request you to kindly pay your Cable TV subscriptions.\n",
+    'due_line': "🔹 {name}: ₹{amount} ({cycle})\n",
+    'multi_due_total': "💰 *Total Amount Due: ₹{total}*\n\n",
+    'upi_details': (
+        "*Payment Options:*\n"
+        "📱 *UPI/Mobile Payment:*\n"
+        "   {upi_number} ({upi_name})\n"
+        "   (GPay/PhonePe/Paytm/WhatsApp)\n\n"
+    ),
+    'bank_details': (
+        "🏦 *Bank Transfer:*\n"
+        "   Account holder: {account_holder}\n"
+        "   A/C No: {account_number}\n"
+        "   Bank: {bank_name}\n"
+        "   Branch: {branch}\n"
+        "   IFSC: {ifsc}\n\n"
+    ),
+    'footer': (
+        "📸 Please share a screenshot after payment.\n\n"
+        "_Note: Please ignore if already paid. This is an automated message._\n\n"
+        "Thank you for your continued support! 🙏\n"
+        "- {business_name}"
+    ),
+}
+
+# Payment mode words that call for bank transfer details in the message
+BANK_TRANSFER_TERMS = ['bank', 'transfer', 'neft', 'imps', 'rtgs']
+
+
+class CompiledTemplate:
+    """A template parsed once into literal text and field names
+
+    Fields whose values are known when the template is compiled are resolved
+    straight away, so rendering only joins strings for the per-message fields.
+    """
+
+    def __init__(self, text: str, static_values: Dict):
+        self.parts: List[Tuple[str, str]] = []
+        literal = ''
+        for literal_text, field, format_spec, conversion in Formatter().parse(text):
+            literal += literal_text
+            if field is None:
+                continue
+            if format_spec or conversion:
+                raise ValueError(f"Format specs are not supported in message templates: {{{field}}}")
+            if field in static_values:
+                literal += str(static_values[field])
+                continue
+            self.parts.append((literal, field))
+            literal = ''
+        self.tail = literal
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        """Names of the fields filled at render time, in template order"""
+        return tuple(field for _, field in self.parts)
+
+    def render(self, values: Dict) -> str:
+        return ''.join(literal + str(values[field]) for literal, field in self.parts) + self.tail
+
+
+class MessageTemplates:
+    """Reminder message templates per language, compiled once and cached per run"""
+
+    def __init__(self, config: Dict):
+        self.default_language = config.get('default_language', 'en')
+        payment_details = config.get('payment_details', {})
+        self.aliases = {
+            alias.strip().lower(): language
+            for language, aliases in config.get('language_aliases', {}).items()
+            for alias in aliases
+        }
+
+        languages = {self.default_language: {}}
+        languages.update(config.get('languages', {}))
+        self.templates: Dict[str, Dict[str, CompiledTemplate]] = {}
+        for language, overrides in languages.items():
+            # Missing parts fall back to the default language, then to the built-in English text
+            base = dict(DEFAULT_TEMPLATES, **languages.get(self.default_language, {}))
+            texts = dict(base, **overrides)
+            self.templates[language] = {
+                part: CompiledTemplate(text, payment_details) for part, text in texts.items()
+            }
+            self.aliases.setdefault(language.lower(), language)
+        misplaced = sorted({f"{{{field}}} in {language}.{part}"
+                            for language, compiled in self.templates.items() for part, template in compiled.items()
+                            for field in template.fields
+                            if field in MESSAGE_FIELDS and field not in PART_FIELDS.get(part, ())})
+        if misplaced:
+            raise ValueError(f"Message template fields not available in their part: {', '.join(misplaced)}")
+        missing = {field for compiled in self.templates.values() for template in compiled.values()
+                   for field in template.fields if field not in MESSAGE_FIELDS}
+        if missing:
+            raise ValueError(f"Missing payment details in message_templates.payment_details: "
+                             f"{', '.join(sorted(missing))}")
+        logging.info(f"Loaded message templates for languages: {', '.join(self.templates)}")
+
+        self._mode_classes: Dict[str, str] = {}
+        self._language_cache: Dict = {}
+        self._render_cache: Dict[Tuple, str] = {}
+
+    def language_for(self, value) -> str:
+        """Map a Language cell to a configured language, falling back to the default"""
+        key = str(value)
+        if key not in self._language_cache:
+            self._language_cache[key] = self.aliases.get(key.strip().lower(), self.default_language)
+        return self._language_cache[key]
+
+    def mode_class(self, mode) -> str:
+        """Classify a payment mode as 'bank' or 'upi' for picking payment details"""
+        key = str(mode)
+        if key not in self._mode_classes:
+            mode_lower = key.lower().strip()
+            is_bank_transfer = any(term in mode_lower for term in BANK_TRANSFER_TERMS)
+            self._mode_classes[key] = 'bank' if is_bank_transfer else 'upi'
+        return self._mode_classes[key]
+
+    def render_reminder(self, dues: List[Dict]) -> str:
+        """Render the reminder for one or more dues sent to the same number"""
+        language = dues[0].get('language') or self.default_language
+        mode_class = 'bank' if any(self.mode_class(due['mode']) == 'bank' for due in dues) else 'upi'
+        if len(dues) == 1:
+            # Keyed by the fields single_due uses, so a template with {name} is not shared between customers
+            single_due = self.templates.get(language, self.templates[self.default_language])['single_due']
+            key = (language, mode_class) + tuple(dues[0][field] for field in single_due.fields)
+            if key not in self._render_cache:
+                self._render_cache[key] = self._render(language, mode_class, dues)
+            return self._render_cache[key]
+        # Merged messages list customer names, so they are rarely repeated and not cached
+        return self._render(language, mode_class, dues)
+
+    def _render(self, language: str, mode_class: str, dues: List[Dict]) -> str:
+        templates = self.templates.get(language, self.templates[self.default_language])
+        if len(dues) == 1:
+            due_details = templates['single_due'].render(dues[0])
+        else:
+            # Several connections share this number, so list each due and the total
+            due_details = (
+                templates['multi_due_intro'].render({})
+                + ''.join(templates['due_line'].render(due) for due in dues)
+                + templates['multi_due_total'].render({'total': sum(due['amount'] for due in dues)})
+            )
+        message = templates['header'].render({}) + due_details + templates['upi_details'].render({})
+        # Include bank details only for bank transfer payment modes
+        if mode_class == 'bank':
+            message += templates['bank_details'].render({})
+        return message + templates['footer'].render({})
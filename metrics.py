@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+# Formats of the exporter file written by RunMetrics.write_exporter_file
+EXPORTER_FORMATS = ('prometheus', 'statsd')
+
+
+class StageStats:
+    """Running count/total/max of a stage's durations plus a bounded sample for percentiles"""
+
+    def __init__(self, max_samples: int = 10000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.max_samples = max_samples
+        self.samples: List[float] = []
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        # Reservoir sampling keeps the sample representative without growing with the run
+        if len(self.samples) < self.max_samples:
+            self.samples.append(seconds)
+        else:
+            slot = random.randrange(self.count)
+            if slot < self.max_samples:
+                self.samples[slot] = seconds
+
+    def percentile(self, fraction: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self) -> Dict:
+        return {
+            'count': self.count,
+            'total_seconds': round(self.total, 6),
+            'mean_seconds': round(self.total / self.count, 6) if self.count else 0.0,
+            'p50_seconds': round(self.percentile(0.5), 6),
+            'p95_seconds': round(self.percentile(0.95), 6),
+            'max_seconds': round(self.max, 6),
+        }
+
+
+class RunMetrics:
+    """Stage timers and counters for one run, written out as a JSON profile"""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.stages: Dict[str, StageStats] = {}
+        self.counters: Dict[str, int] = {}
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        if stage not in self.stages:
+            self.stages[stage] = StageStats()
+        self.stages[stage].observe(seconds)
+
+    def increment(self, counter: str, value: int = 1) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def profile(self) -> Dict:
+        """Return the run profile as a JSON-serializable dict"""
+        duration = time.perf_counter() - self._started
+        rows = self.counters.get('rows', 0)
+        return {
+            'run_id': self.run_id,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            'duration_seconds': round(duration, 6),
+            'rows_per_second': round(rows / duration, 2) if duration else 0.0,
+            'counters': dict(self.counters),
+            'stages': {stage: stats.summary() for stage, stats in self.stages.items()},
+        }
+
+    def write_profile(self, directory: str) -> Optional[str]:
+        """Write the profile to <directory>/run_<run_id>.json and return its path"""
+        path = os.path.join(directory, f"run_{self.run_id}.json")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(self.profile(), f, indent=2)
+            logging.info(f"Run profile written to {path}")
+            return path
+        except Exception as e:
+            logging.error(f"Error writing run profile: {str(e)}")
+            return None
+
+    def write_exporter_file(self, path: str, exporter_format: str = 'prometheus') -> None:
+        """Write counters and stage timings in Prometheus text or StatsD line format
+
+        The Prometheus file suits node_exporter's textfile collector; the StatsD
+        file can be piped to a StatsD agent (e.g. with nc -u).
+        """
+        profile = self.profile()
+        lines = []
+        if exporter_format == 'prometheus':
+            lines.append('# TYPE payment_reminder_run_duration_seconds gauge')
+            lines.append(f"payment_reminder_run_duration_seconds {profile['duration_seconds']}")
+            lines.append('# TYPE payment_reminder_rows_per_second gauge')
+            lines.append(f"payment_reminder_rows_per_second {profile['rows_per_second']}")
+            lines.append('# TYPE payment_reminder_events gauge')
+            for counter, value in sorted(profile['counters'].items()):
+                lines.append(f'payment_reminder_events{{event="{counter}"}} {value}')
+            lines.append('# TYPE payment_reminder_stage_seconds summary')
+            for stage, stats in sorted(profile['stages'].items()):
+                lines.append(f'payment_reminder_stage_seconds{{stage="{stage}",quantile="0.5"}} {stats["p50_seconds"]}')
+                lines.append(f'payment_reminder_stage_seconds{{stage="{stage}",quantile="0.95"}} {stats["p95_seconds"]}')
+                lines.append(f'payment_reminder_stage_seconds_sum{{stage="{stage}"}} {stats["total_seconds"]}')
+                lines.append(f'payment_reminder_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        elif exporter_format == 'statsd':
+            lines.append(f"payment_reminder.run.duration:{profile['duration_seconds'] * 1000:.3f}|ms")
+            lines.append(f"payment_reminder.run.rows_per_second:{profile['rows_per_second']}|g")
+            for counter, value in sorted(profile['counters'].items()):
+                lines.append(f"payment_reminder.events.{counter}:{value}|c")
+            for stage, stats in sorted(profile['stages'].items()):
+                lines.append(f"payment_reminder.stage.{stage}.p50:{stats['p50_seconds'] * 1000:.3f}|ms")
+                lines.append(f"payment_reminder.stage.{stage}.p95:{stats['p95_seconds'] * 1000:.3f}|ms")
+                lines.append(f"payment_reminder.stage.{stage}.total:{stats['total_seconds'] * 1000:.3f}|ms")
+        else:
+            raise ValueError(f"Unknown metrics exporter format: {exporter_format}")
+        try:
+            # Write then rename so a collector never reads a half-written file
+            temporary_path = f"{path}.tmp"
+            with open(temporary_path, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+            os.replace(temporary_path, path)
+        except Exception as e:
+            logging.error(f"Error writing metrics exporter file: {str(e)}")
@@ -0,0 +1,125 @@
+import hashlib
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Separators people type inside numbers: spaces, dashes, dots between groups and brackets
+_SEPARATORS = re.compile(r'[\s\-().]')
+_DIGITS = re.compile(r'\+?\d+')
+# Numeric cells read from Excel or CSV, e.g. 9445393400.0 or 9.4453934E9
+_NUMERIC = re.compile(r'\d+\.\d*|\d+(\.\d*)?[eE][+-]?\d+')
+
+
+def normalize_phone(value: Any, country_code: str = '91', national_digits: int = 10) -> Optional[str]:
+    """Return one phone number in E.164 form (+<country code><number>), or None if it is not a number
+
+    A number of national_digits digits, or one with a leading 0 trunk prefix,
+    gets country_code; numbers written with + or 00 keep their own code.
+    """
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return None
+        value = round(value)
+    text = str(value).strip()
+    # Most cells are plain digits and need none of the clean-up
+    if not text.isdigit():
+        if _NUMERIC.fullmatch(text):
+            text = str(round(float(text)))
+        text = _SEPARATORS.sub('', text)
+        if not _DIGITS.fullmatch(text):
+            return None
+    if text.startswith('+'):
+        digits = text[1:]
+    elif text.startswith('00'):
+        digits = text[2:]
+    else:
+        national = text.lstrip('0')
+        if len(national) == len(country_code) + national_digits and national.startswith(country_code):
+            digits = national
+        else:
+            digits = country_code + national
+    # E.164 allows at most 15 digits; anything under 8 is not a dialable mobile number
+    if not 8 <= len(digits) <= 15:
+        return None
+    return '+' + digits
+
+
+def parse_phone_cell(value: Any, country_code: str = '91',
+                     national_digits: int = 10) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """Split a Number cell on ';' into ([(e164, as written), ...], [entries that are not numbers])
+
+    A number listed twice in one cell is returned once.
+    """
+    phones: List[Tuple[str, str]] = []
+    invalid: List[str] = []
+    seen = set()
+    entries = [value] if isinstance(value, (int, float)) else str(value).split(';')
+    for entry in entries:
+        written = str(entry).strip()
+        if not written:
+            continue
+        phone = normalize_phone(entry, country_code, national_digits)
+        if phone is None:
+            invalid.append(written)
+        elif phone not in seen:
+            seen.add(phone)
+            phones.append((phone, written))
+    return phones, invalid
+
+
+def customer_number_key(phones: List[Tuple[str, str]], invalid: List[str], cell: Any, country_code: str = '91') -> str:
+    """Return the customer number of a Number cell: its first number without the default country code
+
+    A cell whose first entry is not a number is keyed by a hash of that
+    entry, so it still gets a stable key.
+    """
+    primary = str(cell).split(';')[0].strip()
+    if phones and (not invalid or phones[0][1] == primary):
+        phone = phones[0][0]
+        prefix = '+' + country_code
+        return phone[len(prefix):] if phone.startswith(prefix) else phone[1:]
+    return hashlib.md5(primary.encode()).hexdigest()[:10]
+
+
+def parse_phone_cells(values, country_code: str = '91', national_digits: int = 10) -> Dict[Any, Tuple]:
+    """Parse every distinct Number cell once, returning {cell: (phones, invalid, customer number)}"""
+    parsed = {}
+    for cell in values:
+        if cell not in parsed:
+            phones, invalid = parse_phone_cell(cell, country_code, national_digits)
+            parsed[cell] = (phones, invalid, customer_number_key(phones, invalid, cell, country_code))
+    return parsed
+
+
+class PhoneGroups:
+    """Group phone numbers that are written together in a Number cell
+
+    Numbers in one cell join one group, and groups sharing a number merge, so
+    every row whose dues can end up in a message to some number belongs to
+    that number's group. A group is named after its smallest number.
+    """
+
+    def __init__(self, country_code: str = '91', national_digits: int = 10):
+        self.country_code = country_code
+        self.national_digits = national_digits
+        self.parent: Dict[str, str] = {}
+
+    def find(self, phone: str) -> str:
+        """Return the name of the group of an E.164 number"""
+        parent = self.parent
+        root = parent.setdefault(phone, phone)
+        while parent[root] != root:
+            root = parent[root]
+        # Point the numbers on the way straight at the root, so later lookups are short
+        while parent[phone] != root:
+            parent[phone], phone = root, parent[phone]
+        return root
+
+    def add_cells(self, values) -> None:
+        """Merge the groups of the numbers written in each of the Number cells"""
+        for phones, _, _ in parse_phone_cells(values, self.country_code, self.national_digits).values():
+            roots = {self.find(phone) for phone, _ in phones}
+            if len(roots) > 1:
+                smallest = min(roots)
+                for root in roots:
+                    self.parent[root] = smallest
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """Token bucket that hands out send slots at rate per second, up to burst at once
+
+    reserve() always takes a token and returns how long the caller must wait
+    for it, so concurrent callers queue up in order instead of polling.
+    A rate of None means no limit.
+    """
+
+    def __init__(self, rate: Optional[float], burst: float = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        """Take a token and return the seconds until it may be used"""
+        if self.rate is None:
+            return 0.0
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def set_rate(self, rate: float, now: float) -> None:
+        # Tokens earned so far count at the old rate
+        self._refill(now)
+        self.rate = rate
+
+
+class AdaptiveRateLimiter:
+    """Pace sends per transport and per destination, adapting to how sends go
+
+    The transport-wide rate grows by increase_factor after every successful
+    send, up to max_rate, and is cut by decrease_factor after a failure or a
+    send slower than slow_send_seconds, down to min_rate. Messages to one
+    number are additionally spaced per_destination_interval seconds apart.
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: float = 1, min_rate: Optional[float] = None,
+                 max_rate: Optional[float] = None, increase_factor: float = 1.05, decrease_factor: float = 0.5,
+                 slow_send_seconds: Optional[float] = None, per_destination_interval: float = 0):
+        self.bucket = TokenBucket(rate, burst)
+        self.min_rate = min_rate if min_rate is not None else (rate / 10 if rate else None)
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.increase_factor = increase_factor
+        self.decrease_factor = decrease_factor
+        self.slow_send_seconds = slow_send_seconds
+        self.per_destination_interval = per_destination_interval
+        self.destinations: Dict[str, TokenBucket] = {}
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self.bucket.rate
+
+    async def acquire(self, destination: str) -> None:
+        """Wait until a message to destination may be sent"""
+        now = time.monotonic()
+        wait = self.bucket.reserve(now)
+        if self.per_destination_interval:
+            bucket = self.destinations.get(destination)
+            if bucket is None:
+                bucket = self.destinations[destination] = TokenBucket(1 / self.per_destination_interval)
+            wait = max(wait, bucket.reserve(now))
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def record(self, success: bool, latency: float) -> None:
+        """Adapt the transport-wide rate to the outcome of one send"""
+        rate = self.bucket.rate
+        if rate is None:
+            return
+        congested = not success or (self.slow_send_seconds is not None and latency > self.slow_send_seconds)
+        if congested:
+            new_rate = max(self.min_rate, rate * self.decrease_factor)
+            if new_rate < rate:
+                logging.info("Send rate lowered to %.3f messages/s after a %s send",
+                             new_rate, 'failed' if not success else 'slow')
+        else:
+            new_rate = min(self.max_rate, rate * self.increase_factor)
+        self.bucket.set_rate(new_rate, time.monotonic())
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import logging
+import random
+import sqlite3
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Job states
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+SENT = 'sent'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class SendQueue:
+    """SQLite-backed queue of outgoing messages that survives crashes
+
+    Every state change is committed immediately, so after a crash the queue
+    shows exactly which messages were delivered and which are still owed.
+    Jobs are deduplicated per day, destination and content, so
+    re-queuing the same reminder after a restart does not produce a second
+    message, while a reminder for edited data still goes out.
+    """
+
+    def __init__(self, path: str = 'send_queue.db', max_attempts: int = 3,
+                 backoff_base: float = 5, backoff_max: float = 300):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        # WAL with synchronous=NORMAL keeps every commit safe across a process crash
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS send_queue ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'run_id TEXT NOT NULL, '
+            'dedupe_key TEXT NOT NULL UNIQUE, '
+            'phone TEXT NOT NULL, '
+            'message TEXT NOT NULL, '
+            'payload TEXT NOT NULL, '
+            'state TEXT NOT NULL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, '
+            'next_attempt_at REAL NOT NULL, '
+            'last_error TEXT, '
+            'updated_at REAL NOT NULL)'
+        )
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS send_queue_due ON send_queue (state, next_attempt_at)'
+        )
+        # Planned dues of a streaming run, merged per number once the whole sheet is read
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS staged_dues ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'run_id TEXT NOT NULL, '
+            'phone TEXT NOT NULL, '
+            'due TEXT NOT NULL)'
+        )
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS staged_dues_phone ON staged_dues (run_id, phone, id)'
+        )
+
+    def enqueue(self, run_id: str, job: Dict) -> bool:
+        """Add a job for run_id unless the same reminder was already sent today
+
+        The job must have 'phone' and 'message'; other keys are stored as payload.
+        A matching job that is still pending, or was cancelled or gave up, is
+        taken over by run_id instead of being added twice. Returns False if the
+        reminder was already delivered.
+        """
+        now = time.time()
+        payload = {key: value for key, value in job.items() if key not in ('phone', 'message')}
+        dedupe_key = self._dedupe_key(job, payload)
+        cursor = self.connection.execute(
+            'INSERT INTO send_queue '
+            '(run_id, dedupe_key, phone, message, payload, state, next_attempt_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (dedupe_key) DO UPDATE SET '
+            'run_id = excluded.run_id, payload = excluded.payload, updated_at = excluded.updated_at, '
+            'state = CASE WHEN state IN (?, ?) THEN excluded.state ELSE state END, '
+            'attempts = CASE WHEN state IN (?, ?) THEN 0 ELSE attempts END, '
+            'next_attempt_at = CASE WHEN state IN (?, ?) THEN excluded.next_attempt_at ELSE next_attempt_at END '
+            'WHERE state != ?',
+            (run_id, dedupe_key, job['phone'], job['message'], json.dumps(payload), PENDING, now, now,
+             FAILED, CANCELLED, FAILED, CANCELLED, FAILED, CANCELLED, SENT)
+        )
+        return cursor.rowcount == 1
+
+    def _dedupe_key(self, job: Dict, payload: Dict) -> str:
+        content = json.dumps([job['message'], payload], sort_keys=True)
+        digest = hashlib.sha1(content.encode()).hexdigest()[:16]
+        return f"{time.strftime('%Y-%m-%d')}:{job['phone']}:{digest}"
+
+    def was_sent(self, job: Dict) -> bool:
+        """Return True if enqueue() would skip job because the same reminder was delivered today"""
+        payload = {key: value for key, value in job.items() if key not in ('phone', 'message')}
+        return self.connection.execute(
+            'SELECT 1 FROM send_queue WHERE dedupe_key = ? AND state = ?', (self._dedupe_key(job, payload), SENT)
+        ).fetchone() is not None
+
+    def claim_due(self, limit: int = 100) -> List[Dict]:
+        """Mark up to limit due jobs as in flight and return them"""
+        now = time.time()
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            rows = self.connection.execute(
+                'SELECT id, phone, message, payload, attempts FROM send_queue '
+                'WHERE state = ? AND next_attempt_at <= ? ORDER BY next_attempt_at, id LIMIT ?',
+                (PENDING, now, limit)
+            ).fetchall()
+            self.connection.executemany(
+                'UPDATE send_queue SET state = ?, updated_at = ? WHERE id = ?',
+                ((IN_FLIGHT, now, row[0]) for row in rows)
+            )
+        return [
+            dict(json.loads(payload), id=job_id, phone=phone, message=message, attempts=attempts)
+            for job_id, phone, message, payload, attempts in rows
+        ]
+
+    def mark_sent(self, job_id: int) -> None:
+        self.connection.execute(
+            'UPDATE send_queue SET state = ?, attempts = attempts + 1, last_error = NULL, updated_at = ? WHERE id = ?',
+            (SENT, time.time(), job_id)
+        )
+
+    def mark_failed(self, job_id: int, error: str) -> str:
+        """Record a failed attempt and schedule a retry with exponential backoff and jitter
+
+        Returns the job's new state: PENDING if it will be retried, FAILED once
+        max_attempts is reached.
+        """
+        attempts = self.connection.execute(
+            'SELECT attempts FROM send_queue WHERE id = ?', (job_id,)
+        ).fetchone()[0] + 1
+        now = time.time()
+        if attempts >= self.max_attempts:
+            state, next_attempt_at = FAILED, now
+        else:
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+            state, next_attempt_at = PENDING, now + delay * random.uniform(0.5, 1.5)
+        self.connection.execute(
+            'UPDATE send_queue SET state = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? '
+            'WHERE id = ?',
+            (state, attempts, next_attempt_at, error, now, job_id)
+        )
+        return state
+
+    def seconds_until_next(self) -> Optional[float]:
+        """Return how long until the next pending job is due, or None if nothing is pending"""
+        row = self.connection.execute(
+            'SELECT MIN(next_attempt_at) FROM send_queue WHERE state = ?', (PENDING,)
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def recover_in_flight(self) -> int:
+        """Return jobs left in flight by a killed run to the pending state
+
+        Such a message may or may not have gone out before the crash; it is sent
+        again rather than silently dropped.
+        """
+        cursor = self.connection.execute(
+            'UPDATE send_queue SET state = ?, next_attempt_at = ?, updated_at = ? WHERE state = ?',
+            (PENDING, time.time(), time.time(), IN_FLIGHT)
+        )
+        if cursor.rowcount:
+            logging.warning(f"Recovered {cursor.rowcount} messages that were in flight when the last run stopped")
+        return cursor.rowcount
+
+    def cancel_unfinished(self, run_id: str) -> int:
+        """Cancel pending and in-flight jobs left over from runs other than run_id"""
+        cursor = self.connection.execute(
+            'UPDATE send_queue SET state = ?, updated_at = ? WHERE state IN (?, ?) AND run_id != ?',
+            (CANCELLED, time.time(), PENDING, IN_FLIGHT, run_id)
+        )
+        if cursor.rowcount:
+            logging.info(f"Cancelled {cursor.rowcount} unfinished messages from earlier runs")
+        return cursor.rowcount
+
+    def unfinished_customers(self, run_id: str) -> Set[str]:
+        """Return the customer numbers of run_id's jobs that are still pending or in flight"""
+        customers = set()
+        for (payload,) in self.connection.execute(
+            'SELECT payload FROM send_queue WHERE run_id = ? AND state IN (?, ?)', (run_id, PENDING, IN_FLIGHT)
+        ):
+            customers.update(customer['customer_number'] for customer in json.loads(payload).get('customers', [])
+                             if customer.get('customer_number'))
+        return customers
+
+    def stage_dues(self, run_id: str, dues: Iterable[Tuple[str, Dict]]) -> None:
+        """Store (phone, due) pairs until the run is ready to queue them"""
+        with self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.executemany(
+                'INSERT INTO staged_dues (run_id, phone, due) VALUES (?, ?, ?)',
+                ((run_id, phone, json.dumps(due, default=str)) for phone, due in dues)
+            )
+
+    def staged_dues(self, run_id: str) -> Iterator[Tuple[str, List[Dict]]]:
+        """Yield (phone, dues) for every number with staged dues, in staging order per number"""
+        current_phone = None
+        dues: List[Dict] = []
+        for phone, due in self.connection.execute(
+            'SELECT phone, due FROM staged_dues WHERE run_id = ? ORDER BY phone, id', (run_id,)
+        ):
+            if phone != current_phone and dues:
+                yield current_phone, dues
+                dues = []
+            current_phone = phone
+            dues.append(json.loads(due))
+        if dues:
+            yield current_phone, dues
+
+    def clear_staged_dues(self, run_id: str) -> None:
+        self.connection.execute('DELETE FROM staged_dues WHERE run_id = ?', (run_id,))
+
+    def counts(self, run_id: Optional[str] = None) -> Dict[str, int]:
+        """Return the number of jobs in each state, optionally for one run"""
+        if run_id is None:
+            rows = self.connection.execute('SELECT state, COUNT(*) FROM send_queue GROUP BY state')
+        else:
+            rows = self.connection.execute(
+                'SELECT state, COUNT(*) FROM send_queue WHERE run_id = ? GROUP BY state', (run_id,)
+            )
+        return dict(rows.fetchall())
+
+    def close(self) -> None:
+        self.connection.close()
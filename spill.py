@@ -0,0 +1,57 @@
+import json
+import os
+import tempfile
+from typing import Any, Iterable, Iterator, List, Optional
+
+
+class SpillList:
+    """Append-only list that keeps at most max_in_memory items in RAM
+
+    Items beyond the limit are written as JSON lines to a temporary file and
+    read back lazily on iteration, so very large runs do not grow memory with
+    the number of rows. Items must be JSON serializable; values that are not
+    (e.g. numpy scalars) are stored as strings.
+    """
+
+    def __init__(self, max_in_memory: int = 100000):
+        self.max_in_memory = max_in_memory
+        self.items: List[Any] = []
+        self.spill_path: Optional[str] = None
+        self._spill_file = None
+        self._spilled = 0
+
+    def append(self, item: Any) -> None:
+        if len(self.items) < self.max_in_memory:
+            self.items.append(item)
+            return
+        if self._spill_file is None:
+            fd, self.spill_path = tempfile.mkstemp(prefix='payment_reminder_', suffix='.jsonl')
+            self._spill_file = os.fdopen(fd, 'w+', encoding='utf-8')
+        self._spill_file.write(json.dumps(item, default=str) + '\n')
+        self._spilled += 1
+
+    def extend(self, items: Iterable[Any]) -> None:
+        for item in items:
+            self.append(item)
+
+    def __len__(self) -> int:
+        return len(self.items) + self._spilled
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self) -> Iterator[Any]:
+        yield from self.items
+        if self._spill_file is not None:
+            self._spill_file.flush()
+            with open(self.spill_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
+
+    def close(self) -> None:
+        """Delete the spill file"""
+        if self._spill_file is not None:
+            self._spill_file.close()
+            os.remove(self.spill_path)
+            self._spill_file = None
+            self._spilled = 0
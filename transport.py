@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+
+from rate_limit import AdaptiveRateLimiter
+
+
+class Transport:
+    """Base class for WhatsApp delivery backends"""
+    name = 'base'
+    # Maximum number of sends the backend can safely run at the same time
+    max_concurrency = 1
+
+    def send(self, phone: str, message: str) -> None:
+        """Deliver a single message, raising an exception on failure"""
+        raise NotImplementedError
+
+    def rate_limit(self) -> Dict:
+        """Default AdaptiveRateLimiter settings for this backend; empty means no limit"""
+        return {}
+
+    def expected_latency(self) -> float:
+        """Rough number of seconds one send takes, for estimating delivery time"""
+        return 0.0
+
+    async def send_async(self, phone: str, message: str) -> None:
+        """Deliver a single message without blocking the event loop"""
+        await asyncio.to_thread(self.send, phone, message)
+
+
+class PywhatkitTransport(Transport):
+    """Deliver messages through WhatsApp Web using pywhatkit"""
+    name = 'pywhatkit'
+    # pywhatkit drives a single browser window, so sends must stay serial
+    max_concurrency = 1
+
+    def __init__(self, wait_time: int = 15, close_time: int = 3, pause: float = 3):
+        self.wait_time = wait_time
+        self.close_time = close_time
+        # Starting gap between one send finishing and the next starting; the rate limiter narrows it while sends succeed
+        self.pause = pause
+
+    def send(self, phone: str, message: str) -> None:
+        # Imported here so other backends do not need a browser/GUI stack
+        import pywhatkit
+        pywhatkit.sendwhatmsg_instantly(
+            phone,
+            message,
+            self.wait_time,
+            True,
+            self.close_time
+        )
+
+    def expected_latency(self) -> float:
+        return self.wait_time + self.close_time
+
+    def rate_limit(self) -> Dict:
+        # A send keeps the browser busy for about wait_time + close_time seconds
+        cycle = self.wait_time + self.close_time
+        return {
+            'rate': 1 / (cycle + self.pause),
+            # Always leave WhatsApp Web at least a second to settle between chats
+            'max_rate': 1 / (cycle + 1),
+            'min_rate': 1 / (cycle + 4 * self.pause),
+        }
+
+
+class FakeTransport(Transport):
+    """In-memory backend that records messages instead of sending them"""
+    name = 'fake'
+    max_concurrency = 64
+
+    def __init__(self, latency: float = 0, fail_numbers: Optional[List[str]] = None):
+        self.latency = latency
+        self.fail_numbers = set(fail_numbers or [])
+        self.sent: List[Dict] = []
+
+    def send(self, phone: str, message: str) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        self._record(phone, message)
+
+    def expected_latency(self) -> float:
+        return self.latency
+
+    async def send_async(self, phone: str, message: str) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._record(phone, message)
+
+    def _record(self, phone: str, message: str) -> None:
+        if phone in self.fail_numbers:
+            raise RuntimeError(f"Simulated delivery failure for {phone}")
+        self.sent.append({'phone': phone, 'message': message, 'time': time.time()})
+
+
+TRANSPORTS = {
+    PywhatkitTransport.name: PywhatkitTransport,
+    FakeTransport.name: FakeTransport,
+}
+
+
+def create_transport(delivery_config: Dict) -> Transport:
+    """Build the transport named in the delivery config"""
+    backend = delivery_config.get('backend', PywhatkitTransport.name)
+    if backend not in TRANSPORTS:
+        raise ValueError(f"Unknown delivery backend: {backend}")
+    options = delivery_config.get('options', {})
+    return TRANSPORTS[backend](**options)
+
+
+def create_rate_limiter(delivery_config: Dict, transport: Transport) -> AdaptiveRateLimiter:
+    """Build the rate limiter for transport, with rate_limit settings from the config over the backend defaults"""
+    settings = dict(transport.rate_limit())
+    settings.update({key: value for key, value in delivery_config.get('rate_limit', {}).items() if value is not None})
+    return AdaptiveRateLimiter(
+        per_destination_interval=delivery_config.get('per_destination_interval_seconds', 0), **settings
+    )
+
+
+class DeliveryEngine:
+    """Queue outgoing messages and deliver them with asyncio
+
+    Jobs are plain dicts with at least 'phone' and 'message'; any other keys
+    are passed through untouched so callers can act on the results.
+    """
+
+    def __init__(self, transport: Transport, concurrency: int = 1,
+                 limiter: Optional[AdaptiveRateLimiter] = None):
+        self.transport = transport
+        self.concurrency = max(1, min(concurrency, transport.max_concurrency))
+        self.limiter = limiter or AdaptiveRateLimiter(**transport.rate_limit())
+        self.pending: List[Dict] = []
+
+    def estimate_seconds(self, count: int) -> float:
+        """Estimate how long delivering count messages to different numbers takes at the current pacing"""
+        per_message = self.transport.expected_latency() / self.concurrency
+        if self.limiter.rate:
+            per_message = max(per_message, 1 / self.limiter.rate)
+        return count * per_message
+
+    def submit(self, job: Dict) -> None:
+        """Queue a job for the next flush"""
+        self.pending.append(job)
+
+    def flush(self, on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """Deliver all queued jobs and return them annotated with the outcome
+
+        on_result is called with each result as soon as that job finishes, so
+        callers can checkpoint progress while the rest are still in flight.
+        """
+        if not self.pending:
+            return []
+        jobs = self.pending
+        self.pending = []
+        logging.info(f"Delivering {len(jobs)} messages via {self.transport.name} "
+                     f"(concurrency {self.concurrency})")
+        return asyncio.run(self._drain(jobs, on_result))
+
+    async def _drain(self, jobs: List[Dict], on_result: Optional[Callable[[Dict], None]]) -> List[Dict]:
+        queue: asyncio.Queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        destination_locks: Dict[str, asyncio.Lock] = {}
+        results: List[Dict] = []
+
+        async def worker() -> None:
+            while True:
+                try:
+                    job = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                lock = destination_locks.setdefault(job['phone'], asyncio.Lock())
+                async with lock:
+                    result = await self._deliver(job)
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return results
+
+    async def _deliver(self, job: Dict) -> Dict:
+        phone = job['phone']
+        await self.limiter.acquire(phone)
+        start = time.perf_counter()
+        try:
+            await self.transport.send_async(phone, job['message'])
+            result = dict(job, success=True, error=None)
+        except Exception as e:
+            result = dict(job, success=False, error=str(e))
+        # Time spent in the transport only, excluding the rate limiter's wait
+        result['latency'] = time.perf_counter() - start
+        self.limiter.record(result['success'], result['latency'])
+        return result